@@ -0,0 +1,88 @@
+from src.bench import BENCHMARKS, run_suite, compare, load_baseline, save_baseline, bench_parsers, bench_parallel, bench_scaling
+import argparse
+import os
+import sys
+
+
+parser = argparse.ArgumentParser(description='Benchmark compile and run time of the test programs')
+parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+parser.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=2,
+                    help='LLVM optimization level (default: 2)')
+parser.add_argument('-n', '--runs', type=int, default=5, help='measured runs of each benchmark (default: 5)')
+parser.add_argument('-w', '--warmup', type=int, default=1, help='warmup runs of each benchmark (default: 1)')
+parser.add_argument('--baseline', default='bench_baseline.json',
+                    help='baseline file (default: bench_baseline.json)')
+parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+parser.add_argument('--threshold', type=float, default=10,
+                    help='slowdown (in percent) over the baseline reported as a regression (default: 10)')
+parser.add_argument('--parsers', type=int, metavar='FUNCTIONS', default=None,
+                    help='compare the sly and hand written parsers on a generated program of FUNCTIONS functions')
+parser.add_argument('--parallel', type=int, metavar='FUNCTIONS', default=None,
+                    help='compile time of a generated program of FUNCTIONS functions with 1, 2, 4... worker processes')
+parser.add_argument('-j', '--jobs', default=None,
+                    help='comma separated numbers of worker processes for --parallel (default: powers of two up to the CPU count)')
+parser.add_argument('--scaling', nargs='?', const='10000,25000,50000,100000', metavar='SIZES', default=None,
+                    help='parse and codegen time of generated programs of each comma separated number '
+                         'of functions (default: 10000,25000,50000,100000)')
+args = parser.parse_args()
+
+if args.parsers:
+    size, tokens, results = bench_parsers(args.parsers, args.runs)
+    print(f'{args.parsers} functions, {size} bytes, {tokens} tokens\n')
+    print('{:<8} {:>12} {:>14} {:>12}'.format('parser', 'parse (ms)', 'tokens/sec', 'import (ms)'))
+    for name, result in results.items():
+        print('{:<8} {:>12.3f} {:>14.0f} {:>12.3f}'.format(
+            name, result['parse_ns'] / 1e6, result['tokens_per_sec'], result['import_sec'] * 1000))
+    sys.exit()
+
+if args.parallel:
+    jobs = [int(x) for x in args.jobs.split(',')] if args.jobs else None
+    results = bench_parallel(args.parallel, jobs, args.opt_level)
+    print(f'{args.parallel} functions, -O{args.opt_level}\n')
+    print('{:<8} {:>14} {:>10}'.format('jobs', 'compile (ms)', 'speedup'))
+    for n, elapsed in results.items():
+        print('{:<8} {:>14.3f} {:>9.2f}x'.format(n, elapsed / 1e6, results[min(results)] / elapsed))
+    sys.exit()
+
+if args.scaling:
+    results = bench_scaling([int(x) for x in args.scaling.split(',')])
+    print('{:<10} {:>12} {:>14} {:>20}'.format('functions', 'parse (ms)', 'codegen (ms)', 'codegen/function (us)'))
+    for n, result in results.items():
+        print('{:<10} {:>12.3f} {:>14.3f} {:>20.3f}'.format(
+            n, result['parse_ns'] / 1e6, result['codegen_ns'] / 1e6, result['codegen_ns'] / n / 1e3))
+    sys.exit()
+
+for name in args.names:
+    if name not in BENCHMARKS:
+        parser.error(f'unknown benchmark {name}')
+
+results = run_suite(args.names, args.runs, args.warmup, args.opt_level)
+
+baseline = None
+if not args.save and os.path.exists(args.baseline):
+    baseline = load_baseline(args.baseline)
+    if baseline['opt_level'] != args.opt_level:
+        print(f'Baseline was recorded with -O{baseline["opt_level"]}, not comparing')
+        baseline = None
+
+print('{:<20} {:>14} {:>14} {:>10} {:>10}'.format('benchmark', 'compile (ms)', 'run (ms)', 'compile', 'run'))
+for name, result in results.items():
+    change = ['', '']
+    if baseline and name in baseline['results']:
+        for i, metric in enumerate(('compile_ns', 'run_ns')):
+            old = baseline['results'][name][metric]
+            change[i] = '{:+.1f}%'.format((result[metric] - old) / old * 100) if old else ''
+    print('{:<20} {:>14.3f} {:>14.3f} {:>10} {:>10}'.format(
+        name, result['compile_ns'] / 1e6, result['run_ns'] / 1e6, *change))
+
+if args.save:
+    save_baseline(args.baseline, results, args.opt_level)
+    print(f'\nSaved baseline to {args.baseline}')
+elif baseline:
+    regressions = compare(results, baseline['results'], args.threshold / 100)
+    if regressions:
+        print(f'\nRegressions (over {args.threshold}%):')
+        for name, metric, old, new in regressions:
+            print('  {} {}: {:.3f} ms -> {:.3f} ms'.format(name, metric, old / 1e6, new / 1e6))
+        sys.exit(1)
+    print('\nNo regressions')
@@ -0,0 +1,82 @@
+"""
+Thin client of the compile server (python run.py serve), it only uses
+the standard library so it starts in a few milliseconds
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def socket_path():
+    # Same as src.server.socket_path
+    return os.environ.get('GABBY_SOCKET') or os.path.join(tempfile.gettempdir(), f'gabby-{os.getuid()}.sock')
+
+def request(message, path=None):
+    """Sends a request (dict) to the server, returns its response"""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path or socket_path())
+        with connection.makefile('rwb') as stream:
+            stream.write(json.dumps(message).encode('utf8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+    if not line:
+        raise ConnectionError('The server closed the connection')
+    return json.loads(line)
+
+def main(argv):
+    parser = argparse.ArgumentParser(usage='python3 client.py [-O0|-O1|-O2|-O3] [--compile-only] [--json] <filename>\n'
+                                           '       python3 client.py --ping | --shutdown')
+    parser.add_argument('filename', nargs='?')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=0,
+                        help='LLVM optimization level (default: 0)')
+    parser.add_argument('--entry', default='main',
+                        help='function to call (default: main)')
+    parser.add_argument('--compile-only', action='store_true',
+                        help="compile the program without running it")
+    parser.add_argument('--socket', default=None,
+                        help='socket of the server (default: $GABBY_SOCKET or gabby-<uid>.sock in the temporary directory)')
+    parser.add_argument('--json', action='store_true',
+                        help="print the server's response as it is")
+    parser.add_argument('--ping', action='store_true',
+                        help='check the server is running')
+    parser.add_argument('--shutdown', action='store_true',
+                        help='stop the server')
+    args = parser.parse_args(argv)
+
+    if args.ping or args.shutdown:
+        message = {'action':'ping' if args.ping else 'shutdown'}
+    elif args.filename:
+        with open(args.filename, 'r') as file:
+            message = {
+                'action':'compile' if args.compile_only else 'run',
+                'code':file.read(),
+                'opt_level':args.opt_level,
+                'entry':args.entry,
+            }
+    else:
+        parser.error('a filename, --ping or --shutdown is required')
+
+    try:
+        response = request(message, args.socket)
+    except OSError as e:
+        print(f"Can't reach the server ({e}), start it with: python3 run.py serve", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(response, indent=2))
+    elif not response['ok']:
+        print(response['error']['message'], file=sys.stderr)
+    elif 'output' in response:
+        sys.stdout.write(response['output'])
+        print(f"It returns {response['result']}")
+    elif args.ping:
+        print(f"Server running, pid {response['pid']}, {response['requests']} requests served")
+    return 0 if response['ok'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,137 @@
-from src import run_code
+from src import run_code, LexError, ParseError
+from src.compiler.profiler import Profiler
+from src.cache import ObjectCache
+from src.stats import CompileStats
+import argparse
+import os
 import sys
 
 
-if len(sys.argv) >= 2:
-    with open(sys.argv[1],'r') as file:
+def run(argv):
+    parser = argparse.ArgumentParser(usage='python3 run.py [-O0|-O1|-O2|-O3] [-j JOBS] [--cpu CPU] [--cache] [--stats] <filename>\n'
+                                           '       python3 run.py build <filename> [-o <output>]\n'
+                                           '       python3 run.py serve [--socket <path>] [--workers <n>] [--timeout <s>]')
+    parser.add_argument('filename')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=0,
+                        help='LLVM optimization level (default: 0)')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse the machine code of previous runs of the same program')
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache directory (default: $GABBY_CACHE_DIR or ~/.cache/gabby)')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='maximum size of the cache in MB (default: 64)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='compile the functions in this many worker processes')
+    parser.add_argument('--cpu', default=None,
+                        help='CPU to generate code for, host for the one this runs on (default: generic)')
+    parser.add_argument('--features', default=None,
+                        help="CPU features to enable or disable, e.g. +avx2,-avx512f (default: the CPU's)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help='threads parallel loops run on (default: $GABBY_THREADS or the number of CPUs)')
+    parser.add_argument('--profile-generate', metavar='FILE', default=None,
+                        help='count the branches and calls of the program, add the counts to the profile FILE')
+    parser.add_argument('--profile-use', metavar='FILE', default=None,
+                        help='optimize with the branch weights and function entry counts of the profile FILE')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the calls and cycles of every function when the program returns')
+    parser.add_argument('--profile-folded', metavar='FILE', default=None,
+                        help='profile the program and write its call stacks as folded stacks (flame graph input) to FILE')
+    parser.add_argument('--loops', dest='show_loops', action='store_true',
+                        help='print which loops were vectorized and unrolled')
+    parser.add_argument('--no-ir', dest='show_ir', action='store_false',
+                        help="don't print the generated IR")
+    parser.add_argument('--stats', action='store_true',
+                        help='print the time and memory spent in each compilation phase')
+    parser.add_argument('--stats-memory', action='store_true',
+                        help="like --stats, also tracing the peak memory of every phase, which slows the phases down")
+    parser.add_argument('--stats-json', metavar='FILE', default=None,
+                        help='write the compilation statistics as JSON to FILE (- for stdout)')
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        # Read by the program the first time it runs a parallel loop
+        os.environ['GABBY_THREADS'] = str(args.threads)
+
+    stats = None
+    if args.stats or args.stats_json or args.stats_memory:
+        stats = CompileStats(trace_memory=args.stats_memory)
+
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = ObjectCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    profiler = None
+    if args.profile or args.profile_folded:
+        profiler = Profiler()
+
+    with open(args.filename,'r') as file:
+        code = file.read()
+    run_code(code, opt_level=args.opt_level, cache=cache, show_ir=args.show_ir, stats=stats,
+             jobs=args.jobs, cpu=args.cpu, features=args.features, show_loops=args.show_loops,
+             profile_generate=args.profile_generate, profile_use=args.profile_use, profiler=profiler)
+    if args.profile_folded:
+        with open(args.profile_folded, 'w') as file:
+            file.write(profiler.tree.folded())
+
+    if args.stats or args.stats_memory:
+        print()
+        print(stats.report())
+    if args.stats_json == '-':
+        print(stats.to_json(indent=2))
+    elif args.stats_json:
+        with open(args.stats_json, 'w') as file:
+            file.write(stats.to_json(indent=2))
+
+def build(argv):
+    from src.aot import ARTIFACTS, build
+
+    parser = argparse.ArgumentParser(prog='python3 run.py build',
+                                     description='Compile a program ahead of time')
+    parser.add_argument('filename')
+    parser.add_argument('-o', dest='output', default=None,
+                        help='output path, the extension of each artifact is appended to it '
+                             '(default: the file name without its extension)')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=2,
+                        help='LLVM optimization level (default: 2)')
+    parser.add_argument('--emit', default='exe',
+                        help=f'comma separated artifacts to write: {", ".join(ARTIFACTS)} (default: exe)')
+    parser.add_argument('--cpu', default=None,
+                        help='CPU to generate code for, host for the one this runs on (default: generic)')
+    parser.add_argument('--features', default=None,
+                        help="CPU features to enable or disable, e.g. +avx2,-avx512f (default: the CPU's)")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.filename)[0]
+    with open(args.filename,'r') as file:
         code = file.read()
-    run_code(code)
-else:
-    print('Usage: python3 run.py <filename>')
-    raise TypeError('Expected a <file>')
\ No newline at end of file
+
+    for path in build(code, output, args.opt_level, args.emit.split(','), cpu=args.cpu, features=args.features):
+        print(f'Wrote {path}')
+
+def serve(argv):
+    from src.server import serve
+
+    parser = argparse.ArgumentParser(prog='python3 run.py serve',
+                                     description='Compile server, keeps LLVM warm and compiles and runs '
+                                                 'the programs client.py sends to it')
+    parser.add_argument('--socket', default=None,
+                        help='path of the Unix socket (default: $GABBY_SOCKET or gabby-<uid>.sock in the temporary directory)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='connections served at the same time (default: 4)')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='seconds a program can run before its client gets an error (default: 10)')
+    args = parser.parse_args(argv)
+
+    serve(args.socket, args.workers, args.timeout)
+
+
+try:
+    if len(sys.argv) >= 2 and sys.argv[1] == 'build':
+        build(sys.argv[2:])
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'serve':
+        serve(sys.argv[2:])
+    else:
+        run(sys.argv[1:])
+except (LexError, ParseError) as e:
+    print(e)
+    sys.exit(1)
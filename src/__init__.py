@@ -1,46 +1,238 @@
-from src.pparser.Lexer import PLexer
-from src.pparser.Parser import PParser
+from src.pparser.Lexer import PLexer, LexError
+from src.pparser.FastLexer import FastLexer
+from src.pparser.FastParser import FastParser, ParseError
 from src.compiler.compiler import Compiler
+from src.compiler.optimizer import optimize
+from src.compiler.loops import loop_report
+from src.compiler.profile import Counters, Profile
+from src.compiler.profiler import Profiler
+from src.compiler.runtime import redirect_output
+from src.cache import ObjectCache
+from src.stats import CompileStats, phase, count_nodes, count_instructions
 
 import llvmlite.binding as llvm
-from ctypes import CFUNCTYPE, c_int, c_float
+from ctypes import CFUNCTYPE, c_int
 from time import time
 
 
-def run_code(code):
-    compiler = Compiler()
-    lexer = PLexer()
+_initialized = False
+
+def initialize_llvm():
+    """Initializes LLVM and the native target, only the first call does anything"""
+
+    global _initialized
+    if not _initialized:
+        llvm.initialize()
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+        _initialized = True
+
+def target_cpu(cpu=None, features=None):
+    """
+    (cpu, features) a target machine is created for. 'host' is the CPU
+    this runs on, with all of its features unless `features` are given.
+    The generic CPU of the triple by default
+    """
+
+    if cpu == 'host':
+        cpu = llvm.get_host_cpu_name()
+        if features is None:
+            features = llvm.get_host_cpu_features().flatten()
+    return cpu or '', features or ''
+
+def create_target_machine(cpu=None, features=None, **kwargs):
+    """
+    Target machine of the default triple for a CPU and features ('+avx2,-avx512f'...),
+    see target_cpu. Other arguments go to llvmlite's create_target_machine
+    """
+
+    initialize_llvm()
+    cpu, features = target_cpu(cpu, features)
+    return llvm.Target.from_default_triple().create_target_machine(cpu=cpu, features=features, **kwargs)
+
+def parse(code, stats=None):
+    """Lexes and parses the code, returns its top level statements"""
+
+    lexer = FastLexer()
     tokens = lexer.tokenize(code)
-    parser = PParser()
-    parser.parse(tokens)
+    if stats is not None:
+        # tokenize is lazy, consume it to time lexing on its own
+        with stats.phase('lex'):
+            tokens = list(tokens)
+        stats.count('tokens', len(tokens))
+        tokens = iter(tokens)
+
+    parser = FastParser()
+    with phase(stats, 'parse'):
+        parser.parse(tokens)
     ast = parser.ast
-    ast = ast[1]['body']
+    return ast[1]['body']
+
+def generate_ir(code, name='main', stats=None, counters=None, profile=None, profiler=None, ast=None):
+    """
+    Lexes, parses and compiles the code to an llvmlite ir.Module,
+    instrumented when given Counters and with the branch weights of a
+    Profile when given one (see src.compiler.profile), recording its
+    calls and cycles when given a Profiler (see src.compiler.profiler).
+    The code isn't parsed again when its `ast` is given
+    """
+
+    compiler = Compiler(name, counters=counters, profile=profile, profiler=profiler)
+    if ast is None:
+        ast = parse(code, stats)
     #print(pprint.pformat(ast))
-    compiler.compile(ast)
-    module = compiler.module
 
-    module.triple = llvm.get_default_triple()
-    llvm.initialize()
-    llvm.initialize_native_target()
-    llvm.initialize_native_asmprinter()
+    with phase(stats, 'codegen'):
+        compiler.compile(ast)
+
+    if stats is not None:
+        stats.count('ast_nodes', count_nodes(ast))
+        stats.count('functions', len([x for x in compiler.module.functions if not x.is_declaration]))
+    return compiler.module
+
+def run_code(code, opt_level=0, cache=None, show_ir=True, stats=None, jobs=None,
+             cpu=None, features=None, show_loops=False, output=None,
+             profile_generate=None, profile_use=None, profiler=None):
+    """
+    Compiles the code and runs its main function, returns what main returns.
+    A CompileStats instance can be given to collect per phase timings.
+    With jobs > 1 the functions are compiled and optimized by that many
+    worker processes (see src.parallel). The code is generated for `cpu`
+    and `features` (see target_cpu), show_loops prints which loops were
+    vectorized and unrolled. What the program prints goes to
+    output.write (bytes) when `output` is given, stdout otherwise.
+
+    With profile_generate (a path) the code counts its function entries,
+    branches and calls, the counts are added to that profile file when
+    main returns. Such code is compiled without jobs and isn't cached.
+    profile_use (a Profile or a path) gives the branches and functions
+    the weights and entry counts of a previous run.
+
+    With a Profiler every function records its calls and the cycles
+    spent in it by chain of callers, the report is printed when main
+    returns and the CallTree is left in profiler.tree. Such code is
+    compiled without jobs and isn't cached either
+    """
+
+    initialize_llvm()
+
+    counters = None
+    if profile_generate is not None:
+        counters = Counters()
+    if profile_generate is not None or profiler is not None:
+        cache = None
+        jobs = None
+    if isinstance(profile_use, str):
+        profile_use = Profile.load(profile_use)
 
-    llvm_ir_parsed = llvm.parse_assembly(str(module))
-    llvm_ir_parsed.verify()
+    triple = llvm.get_default_triple()
+    cpu, features = target_cpu(cpu, features)
+    target_machine = create_target_machine(cpu, features)
+
+    if cache is not None:
+        with phase(stats, 'cache_load'):
+            key = cache.key(code, opt_level, triple, cpu, features,
+                            profile_use.fingerprint() if profile_use is not None else None)
+            obj = cache.load(key)
+        if obj is not None:
+            # Warm start, MCJIT loads the cached object in place of the
+            # (empty) module so there is nothing to lex, parse or compile
+            engine = llvm.create_mcjit_compiler(llvm.parse_assembly(''), target_machine)
+            engine.set_object_cache(None, lambda module: obj)
+            with phase(stats, 'finalize_object'):
+                engine.finalize_object()
+            print(f'Loaded from cache {cache.path(key)}')
+            print()
+            return execute(engine, stats, output)
+
+    # The loop report needs the AST too, the code is parsed once for both
+    ast = parse(code, stats) if show_loops else None
+
+    if jobs is not None and jobs > 1:
+        from src.parallel import compile_parallel
+
+        # Already optimized by the workers
+        llvm_ir_parsed = compile_parallel(code, opt_level, jobs, triple, stats, cpu, features, profile_use, ast)
+        with phase(stats, 'verify'):
+            llvm_ir_parsed.verify()
+
+        if stats is not None:
+            stats.count('ir_instructions_optimized', count_instructions(llvm_ir_parsed))
+
+        if show_ir:
+            print(f'The llvm IR generated (-O{opt_level}) is:')
+            print(llvm_ir_parsed)
+            print()
+    else:
+        llvm_ir_parsed = compile_serial(code, opt_level, triple, target_machine, show_ir, stats,
+                                        counters, profile_use, profiler, ast)
+
+    if show_loops:
+        print(loop_report(llvm_ir_parsed, ast))
+        print()
 
-    target_machine = llvm.Target.from_default_triple().create_target_machine()
     engine = llvm.create_mcjit_compiler(llvm_ir_parsed, target_machine)
-    engine.finalize_object()
+    if cache is not None:
+        cache.attach(engine, key)
+    with phase(stats, 'finalize_object'):
+        engine.finalize_object()
+    result = execute(engine, stats, output)
+
+    if counters is not None:
+        profile = counters.read(engine.get_global_value_address).update_file(profile_generate)
+        print(f'\nProfile written to {profile_generate}')
+        print(profile.report())
+    if profiler is not None:
+        print()
+        print(profiler.read(engine.get_global_value_address).report())
+    return result
+
+def compile_serial(code, opt_level, triple, target_machine, show_ir=True, stats=None,
+                   counters=None, profile=None, profiler=None, ast=None):
+    """Compiles and optimizes the code (or its `ast`) to a parsed module, the way run_code does without jobs"""
+
+    module = generate_ir(code, stats=stats, counters=counters, profile=profile, profiler=profiler, ast=ast)
+    module.triple = triple
+    module.data_layout = str(target_machine.target_data)
+
+    with phase(stats, 'parse_assembly'):
+        llvm_ir_parsed = llvm.parse_assembly(str(module))
+    with phase(stats, 'verify'):
+        llvm_ir_parsed.verify()
+
+    if stats is not None:
+        stats.count('ir_instructions', count_instructions(llvm_ir_parsed))
+
+    if show_ir:
+        print('The llvm IR generated is:')
+        print(module)
+        print()
+
+    if opt_level:
+        with phase(stats, 'optimize'):
+            opt_time = optimize(llvm_ir_parsed, opt_level, target_machine)
+
+        if stats is not None:
+            stats.count('ir_instructions_optimized', count_instructions(llvm_ir_parsed))
+
+        if show_ir:
+            print(f'The llvm IR after -O{opt_level} is:')
+            print(llvm_ir_parsed)
+        print('Optimized (-O{}) in {:f} sec'.format(opt_level, opt_time))
+        print()
+
+    return llvm_ir_parsed
 
+def execute(engine, stats=None, output=None):
     # Run the function with name func_name. This is why it makes sense to have a 'main' function that calls other functions.
     entry = engine.get_function_address('main')
     cfunc = CFUNCTYPE(c_int)(entry)
 
-    print('The llvm IR generated is:')
-    print(module)
-    print()
     start_time = time()
-    result = cfunc()
+    with phase(stats, 'execute'), redirect_output(engine.get_global_value_address('gabby.output'), output):
+        result = cfunc()
     end_time = time()
 
     print(f'It returns {result}')
-    print('\nExecuted in {:f} sec'.format(end_time - start_time))
\ No newline at end of file
+    print('\nExecuted in {:f} sec'.format(end_time - start_time))
+    return result
@@ -0,0 +1,78 @@
+from src import create_target_machine, generate_ir, initialize_llvm
+from src.compiler.optimizer import optimize
+
+import llvmlite.binding as llvm
+import os
+import subprocess
+import tempfile
+
+
+# Artifacts `build` can emit and the extension of their file
+ARTIFACTS = {
+    'exe':'',
+    'obj':'.o',
+    'asm':'.s',
+    'll':'.ll',
+    'bc':'.bc',
+}
+
+def build(code, output, opt_level=2, emit=('exe',), cc=None, cpu=None, features=None):
+    """
+    Compiles the code ahead of time, `emit` chooses the artifacts:
+    exe (native executable linked against libc), obj, asm, ll or bc.
+    cpu and features choose the target (see target_cpu), the generic
+    CPU by default so executables run on any machine of the triple.
+    Returns the paths of the files written
+    """
+
+    for kind in emit:
+        if kind not in ARTIFACTS:
+            raise ValueError(f'Unknown artifact {kind!r}, expected one of {", ".join(ARTIFACTS)}')
+
+    initialize_llvm()
+
+    # Position independent so it can be linked in a PIE executable
+    target_machine = create_target_machine(cpu, features, reloc='pic', codemodel='default', opt=opt_level)
+
+    module = generate_ir(code)
+    module.triple = target_machine.triple
+    module.data_layout = str(target_machine.target_data)
+
+    llvm_ir_parsed = llvm.parse_assembly(str(module))
+    llvm_ir_parsed.verify()
+    optimize(llvm_ir_parsed, opt_level, target_machine)
+
+    written = []
+    for kind in emit:
+        path = output + ARTIFACTS[kind]
+        if kind == 'exe':
+            link(target_machine.emit_object(llvm_ir_parsed), path, cc)
+        elif kind == 'obj':
+            with open(path, 'wb') as file:
+                file.write(target_machine.emit_object(llvm_ir_parsed))
+        elif kind == 'asm':
+            with open(path, 'w') as file:
+                file.write(target_machine.emit_assembly(llvm_ir_parsed))
+        elif kind == 'll':
+            with open(path, 'w') as file:
+                file.write(str(llvm_ir_parsed))
+        elif kind == 'bc':
+            with open(path, 'wb') as file:
+                file.write(llvm_ir_parsed.as_bitcode())
+        written.append(path)
+
+    return written
+
+def link(obj, output, cc=None):
+    """Links object code against libc (and libm, frem lowers to fmod, and pthreads for parallel loops) with the system C compiler"""
+
+    cc = cc or os.environ.get('CC', 'cc')
+    with tempfile.TemporaryDirectory() as tmp:
+        obj_path = os.path.join(tmp, 'main.o')
+        with open(obj_path, 'wb') as file:
+            file.write(obj)
+
+        result = subprocess.run([cc, obj_path, '-o', output, '-lm', '-pthread'],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f'Linking with {cc} failed:\n{result.stdout.decode(errors="replace")}')
@@ -0,0 +1,303 @@
+from src.session import Session
+
+from contextlib import contextmanager
+from statistics import median
+from time import perf_counter_ns
+import ctypes
+import json
+import os
+import subprocess
+import sys
+
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test')
+
+def read_test(name):
+    with open(os.path.join(TEST_DIR, name), 'r') as file:
+        return file.read()
+
+def mandelbrot(width=80, height=40, threshold=1000):
+    """test/mandelbrot_set.test at another resolution and iteration threshold"""
+
+    code = read_test('mandelbrot_set.test')
+    code = code.replace('width = 80.0', f'width = {float(width)}')
+    code = code.replace('height = 40.0', f'height = {float(height)}')
+    return code.replace('threshhold = 1000', f'threshhold = {int(threshold)}')
+
+def parallel_mandelbrot(threshold=5000):
+    """parallel_rows of test/parallel.test, the rows of the grid are spread across threads"""
+
+    code = read_test('parallel.test')
+    code = code[:code.index('def main()')]
+    return code + f'''
+def main():int{{
+    return parallel_rows(400, 200, {int(threshold)})
+}}
+'''
+
+def recursion(depth=100000):
+    """Non tail recursive function, `depth` frames deep"""
+
+    return f'''
+def depth(n:int):int{{
+    if n <= 0{{
+        return 0
+    }}
+    return 1 + depth(n-1)
+}}
+
+def main():int{{
+    return depth({int(depth)})
+}}
+'''
+
+def loop(n=10000000):
+    """Arithmetic in a single hot loop"""
+
+    return f'''
+def main():int{{
+    i = 0
+    total = 0
+    while i < {int(n)}{{
+        total = total + i % 7 * 3 - 1
+        i = i + 1
+    }}
+    return total
+}}
+'''
+
+def generate_program(functions=1000):
+    """Large program made of many small functions, to benchmark the front end"""
+
+    parts = []
+    for i in range(functions):
+        parts.append(f'''
+def f{i}(a:int, b:float):int{{
+    x = a * 2 + {i} - (a << 1) / 3
+    y = b * 1.5 - 0.25
+    while x > 0{{
+        if (x % 2) == 0{{
+            x = x - 1
+        }}else{{
+            x = x - 3
+        }}
+        y = y + 1.0
+    }}
+    printf('%i\\n', x)
+    return x
+}}
+''')
+    calls = '\n'.join(f'    total = total + f{i}({i}, 1.0)' for i in range(0, functions, max(1, functions // 100)))
+    parts.append(f'''
+def main():int{{
+    total = 0
+{calls}
+    return total
+}}
+''')
+    return ''.join(parts)
+
+# name -> function returning the program's source
+BENCHMARKS = {
+    'fact':lambda: read_test('fact.test'),
+    'if':lambda: read_test('if.test'),
+    'loops':lambda: read_test('loops.test'),
+    'math':lambda: read_test('math.test'),
+    'mandelbrot':lambda: read_test('mandelbrot_set.test'),
+    'mandelbrot_large':lambda: mandelbrot(320, 160, 5000),
+    'mandelbrot_parallel':lambda: parallel_mandelbrot(5000),
+    'recursion_deep':lambda: recursion(100000),
+    'loop_10m':lambda: loop(10000000),
+}
+
+@contextmanager
+def silence_stdout():
+    """Sends what the programs print (through libc's stdout, fd 1) to /dev/null"""
+
+    libc = ctypes.CDLL(None)
+    libc.fflush(None)
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        libc.fflush(None)
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+def run_benchmark(code, runs=5, warmup=1, opt_level=2, session=None):
+    """
+    Compiles and runs the code warmup + runs times, compile and run
+    times (in ns) of the last `runs` iterations are returned separately
+    """
+
+    session = session or Session(opt_level)
+    compile_times = []
+    run_times = []
+    with silence_stdout():
+        for i in range(warmup + runs):
+            start = perf_counter_ns()
+            program = session.compile(code)
+            compiled = perf_counter_ns()
+            program.run()
+            done = perf_counter_ns()
+
+            if i >= warmup:
+                compile_times.append(compiled - start)
+                run_times.append(done - compiled)
+
+    return {
+        'compile_ns':median(compile_times),
+        'run_ns':median(run_times),
+        'compile_min_ns':min(compile_times),
+        'run_min_ns':min(run_times),
+        'runs':runs,
+    }
+
+def run_suite(names=None, runs=5, warmup=1, opt_level=2):
+    """Runs the benchmarks (all of them by default), returns name -> result"""
+
+    session = Session(opt_level)
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = run_benchmark(BENCHMARKS[name](), runs, warmup, opt_level, session)
+    return results
+
+def import_time(module):
+    """Seconds it takes a fresh interpreter to import the module"""
+
+    root = os.path.dirname(TEST_DIR)
+    code = ('import time, sys\n'
+            'start = time.perf_counter()\n'
+            f'import {module}\n'
+            'sys.stdout.write(str(time.perf_counter() - start))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=root,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    return float(output)
+
+def bench_parsers(functions=2000, runs=3):
+    """
+    Parse throughput (tokens per second) of PParser (sly) and
+    FastParser on a generated program, and the import time of each
+    parser's module (which for PParser includes building its LALR tables)
+    """
+
+    from src.pparser.FastLexer import FastLexer
+    from src.pparser.FastParser import FastParser
+    from src.pparser.Parser import PParser
+
+    code = generate_program(functions)
+    tokens = list(FastLexer().tokenize(code))
+
+    results = {}
+    for name, parser_class, module in [('sly', PParser, 'src.pparser.Parser'),
+                                       ('fast', FastParser, 'src.pparser.FastParser')]:
+        times = []
+        for i in range(runs):
+            parser = parser_class()
+            start = perf_counter_ns()
+            parser.parse(iter(tokens))
+            times.append(perf_counter_ns() - start)
+        results[name] = {
+            'parse_ns':min(times),
+            'tokens_per_sec':len(tokens) / (min(times) / 1e9),
+            'import_sec':import_time(module),
+        }
+
+    # Both must build the same tree
+    sly, fast = PParser(), FastParser()
+    sly.parse(iter(tokens))
+    fast.parse(iter(tokens))
+    assert sly.ast == fast.ast
+
+    return len(code), len(tokens), results
+
+def bench_parallel(functions=2000, jobs=None, opt_level=2):
+    """
+    Wall clock time to compile (up to machine code) a generated program
+    serially and with src.parallel for each number of worker processes
+    in `jobs` (powers of two up to os.cpu_count() by default), checks
+    every build's main returns the same as the serial one
+    """
+
+    from src import compile_serial, create_target_machine, execute, initialize_llvm
+    from src.parallel import compile_parallel
+    import llvmlite.binding as llvm
+
+    if jobs is None:
+        jobs = [1]
+        while jobs[-1] * 2 <= (os.cpu_count() or 1):
+            jobs.append(jobs[-1] * 2)
+
+    initialize_llvm()
+    code = generate_program(functions)
+    triple = llvm.get_default_triple()
+
+    results = {}
+    expected = None
+    for n in jobs:
+        with silence_stdout():
+            start = perf_counter_ns()
+            # The engine takes ownership of the target machine
+            target_machine = create_target_machine()
+            if n == 1:
+                module = compile_serial(code, opt_level, triple, target_machine, show_ir=False)
+            else:
+                module = compile_parallel(code, opt_level, n, triple)
+            engine = llvm.create_mcjit_compiler(module, target_machine)
+            engine.finalize_object()
+            elapsed = perf_counter_ns() - start
+            result = execute(engine)
+
+        if expected is None:
+            expected = result
+        assert result == expected, f'{n} jobs: main returned {result}, expected {expected}'
+        results[n] = elapsed
+    return results
+
+def bench_scaling(sizes=(10000, 25000, 50000, 100000)):
+    """
+    Parse and codegen time of generated programs of each number of
+    functions in `sizes`, the time per function should stay about the
+    same as the program grows
+    """
+
+    from src import parse
+    from src.compiler.compiler import Compiler
+
+    results = {}
+    for n in sizes:
+        code = generate_program(n)
+        start = perf_counter_ns()
+        ast = parse(code)
+        parsed = perf_counter_ns()
+        Compiler().compile(ast)
+        done = perf_counter_ns()
+        results[n] = {'parse_ns':parsed - start, 'codegen_ns':done - parsed}
+    return results
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Returns (name, metric, baseline, current) for every median time
+    more than `threshold` (fraction) slower than in the baseline
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('compile_ns', 'run_ns'):
+            old, new = baseline[name][metric], result[metric]
+            if old and (new - old) / old > threshold:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+def load_baseline(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def save_baseline(path, results, opt_level):
+    with open(path, 'w') as file:
+        json.dump({'opt_level':opt_level, 'results':results}, file, indent=2)
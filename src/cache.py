@@ -0,0 +1,137 @@
+import llvmlite.binding as llvm
+import hashlib
+import os
+import tempfile
+
+
+# Bump this when the layout of the cache directory changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'gabby')
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+_compiler_hash = None
+
+def compiler_hash():
+    """Hash of the lexer, parser and compiler sources, so codegen changes invalidate the cache"""
+
+    global _compiler_hash
+    if _compiler_hash is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        for folder in ('pparser', 'compiler'):
+            path = os.path.join(root, folder)
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.py'):
+                    with open(os.path.join(path, name), 'rb') as file:
+                        h.update(name.encode('utf8'))
+                        h.update(file.read())
+        _compiler_hash = h.hexdigest()
+    return _compiler_hash
+
+class ObjectCache:
+    """
+    Content addressed on-disk cache of the machine code MCJIT emits,
+    entries are evicted least recently used first once the directory
+    grows over `max_size` bytes
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or os.environ.get('GABBY_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, code, opt_level=0, triple='', cpu='', features='', profile=None):
+        """Key of a program compiled with the given configuration, `profile` is the fingerprint of its Profile"""
+
+        h = hashlib.sha256()
+        config = [CACHE_VERSION, compiler_hash(), llvm.llvm_version_info,
+                  opt_level, triple, cpu, features]
+        if profile is not None:
+            config.append(profile)
+        h.update(repr(config).encode('utf8'))
+        h.update(hashlib.sha256(code.encode('utf8')).digest())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.o')
+
+    def load(self, key):
+        """Returns the cached object code or None"""
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        # The modification time is used as the last access time
+        # (atime is not updated on most mounts)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def save(self, key, data):
+        path = self.path(key)
+        # A file of its own for every thread and process saving the entry
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+
+            # Atomic, so concurrent jobs never see half written objects
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, path) of every entry, oldest first"""
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.o'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_size"""
+
+        entries = self.entries()
+        size = sum(x[1] for x in entries)
+        for _, n, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= n
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def attach(self, engine, key):
+        """
+        Hooks the cache into an MCJIT engine: objects it compiles are
+        stored under `key` and a cached object is used instead of
+        compiling the module
+        """
+
+        def notify(module, buffer):
+            self.save(key, buffer)
+
+        def getbuffer(module):
+            return self.load(key)
+
+        engine.set_object_cache(notify, getbuffer)
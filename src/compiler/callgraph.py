@@ -0,0 +1,22 @@
+from src.pparser.nodes import Node
+
+
+def signature(defn):
+    """(return type, parameter types) of a Def"""
+
+    return defn.return_type, tuple(x.type for x in defn.def_params if x)
+
+def callees(defn):
+    """Names of the functions a Def calls"""
+
+    names = set()
+    stack = [defn.body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Node):
+            if node.kind == 'FuncCall' and node.name != 'printf':
+                names.add(node.name)
+            stack.extend(node.children())
+    return names
@@ -1,12 +1,71 @@
-from src.pparser.Lexer import PLexer
-from src.pparser.Parser import PParser
+
+from src.compiler.runtime import MAX_THREADS, TASK, OutputRuntime, ParallelRuntime, ProfilerRuntime, parse_format
+from src.compiler.scope import Scope
+from src.compiler.profile import count_sites, digest
+from src.compiler.vectors import MASK_TYPES, VECTOR_BUILTINS, VECTOR_TYPES, is_mask
+from src.compiler.effects import function_attributes
+from src.compiler import vectors
+from src.pparser.nodes import Node
 
 from llvmlite import ir
-import pprint
+from llvmlite.ir.values import FunctionAttributes
+
+# Binary operators: op -> (unbound) IRBuilder method
+FLOAT_OPS = {
+    '+':ir.IRBuilder.fadd,
+    '*':ir.IRBuilder.fmul,
+    '/':ir.IRBuilder.fdiv,
+    '%':ir.IRBuilder.frem,
+    '-':ir.IRBuilder.fsub,
+}
+
+INT_OPS = {
+    '+':ir.IRBuilder.add,
+    '*':ir.IRBuilder.mul,
+    '/':ir.IRBuilder.sdiv,
+    '%':ir.IRBuilder.srem,
+    '-':ir.IRBuilder.sub,
+}
+
+# These keep the type of their operands (i1 for booleans)
+BITWISE_OPS = {
+    '&':ir.IRBuilder.and_,
+    '|':ir.IRBuilder.or_,
+    '^':ir.IRBuilder.xor,
+    '>>':ir.IRBuilder.ashr,
+    '<<':ir.IRBuilder.shl,
+}
+
+COMPARISONS = {'<', '<=', '>', '>=', '!=', '=='}
+
+# Reductions of parallel loops: op -> value every thread starts from
+REDUCTION_IDENTITY = {'+':0, '*':1}
+
+def parallel_body_names(body):
+    """Names of the variables the body of a parallel loop uses, return statements aren't allowed in it"""
+
+    names = set()
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Node):
+            if node.kind == 'Return':
+                raise SyntaxError("return can't be used in the body of a parallel loop")
+            if node.kind == 'Name':
+                names.add(node.value)
+            elif node.kind in ('VarAssign', 'Index', 'IndexAssign'):
+                names.add(node.name)
+            elif node.kind == 'Parallel':
+                names.update(x for _, x in node.reductions)
+            stack.extend(node.children())
+    return names
 
 class Compiler:
     
-    def __init__(self):
+    def __init__(self, name='main', hoist_allocas=True, symbols=None, tail_calls=True, buffered_output=True,
+                 counters=None, profile=None, profiler=None, attributes=None):
         self.type_map = {
             'bool':ir.IntType(1),
             'int':ir.IntType(32),
@@ -16,78 +75,282 @@ class Compiler:
             'str':ir.ArrayType(ir.IntType(8),1), # Note i8 in most languages are characters
         }
 
-        self.module = ir.Module('main')
+        # Arrays (type[]) are pointers to their first element, their length is passed separately
+        for x in ('int','float','double'):
+            self.type_map[f'{x}[]'] = self.type_map[x].as_pointer()
+
+        # Fixed width vectors and the masks comparing them gives (see vectors.py)
+        for x,(element,lanes) in VECTOR_TYPES.items():
+            self.type_map[x] = ir.VectorType(self.type_map[element],lanes)
+        for x,lanes in MASK_TYPES.items():
+            self.type_map[x] = ir.VectorType(ir.IntType(1),lanes)
+
+        self.module = ir.Module(name)
         
         # Defining builtin function (printf)
         fnty = ir.FunctionType(self.type_map['int'], [ir.IntType(8).as_pointer()], var_arg=True)
         func = ir.Function(self.module, fnty, 'printf')
 
-        # This helps to keep track of Defined Variabled
-        self.variables = {'printf':(func,ir.IntType(32))}
+        # Functions (and printf) are defined in the module's scope, the
+        # variables of a function in the function's scope (see Scope)
+        self.globals = Scope()
+        self.globals['printf'] = func,ir.IntType(32)
+
+        # Scope of the code being compiled
+        self.variables = self.globals
+
+        # String literals already emitted as globals (bytes -> pointer to the first character)
+        self.string_constants = {}
         
         # Current Builder
         self.builder = None
+
+        # When set every alloca goes to the entry block of the function (see alloca)
+        self.hoist_allocas = hoist_allocas
+
+        # Builder of the current function's entry block
+        self.entry_builder = None
+
+        # When set `return f(...)` is compiled as a jump back to the start of
+        # the function if f is the current function, a tail call otherwise
+        self.tail_calls = tail_calls
+
+        # (name, body block, parameter pointers) of the current function, for self tail calls
+        self.loop_target = None
+
+        # Name of the function being compiled
+        self.function_name = None
+
+        # When set printf writes to a buffer (see OutputRuntime) which is
+        # flushed when main returns, instead of calling libc's printf
+        self.buffered_output = buffered_output
+        self.output = None
+
+        # Set in the bodies of parallel loops of buffered programs, the threads
+        # can't share the buffer so printf writes its text out at once
+        self.unbuffered_output = False
+
+        # Runtime of the parallel loops (see ParallelRuntime), emitted for the first one
+        self.parallel = None
+
+        # When set (a profile.Counters) the functions count their entries, which way
+        # their branches go and their calls, see count_branch and count_call
+        self.counters = counters
+
+        # When set (a profile.Profile) the branches get weights and the functions
+        # entry counts from the function's profile
+        self.profile = profile
+
+        # Counters of the current function (global array and its sites), its
+        # FunctionProfile and the number of branches emitted so far
+        self.function_counters = None
+        self.function_profile = None
+        self.branch_sites = 0
+
+        # When set (a profiler.Profiler) every function, printf call and parallel
+        # loop records its calls and cycles in the ProfilerRuntime's call tree
+        self.profiler = profiler
+        self.profiler_runtime = None
+
+        # (node, start cycle) of the current function, see profile_enter
+        self.profiler_frame = None
+
+        # Function name -> LLVM attributes (see effects.function_attributes),
+        # the ones of the Defs compile is given are added to these
+        self.attributes = dict(attributes or {})
+
+        # Function name -> name of its symbol in the module (the same name by default)
+        self.symbols = symbols or {}
+
+        # Function name -> global holding a pointer to the function (see declare_slot)
+        self.slots = {}
+
+        # Function name -> (return type, parameter types) of the functions defined
+        self.signatures = {}
         
         self.i = 0
+
+        # Node kind -> visitor, statements and values
+        self.statement_visitors = {
+            'VarAssign':self.visit_assign,
+            'IndexAssign':self.visit_index_assign,
+            'Def':self.visit_def,
+            'Return':self.visit_return,
+            'If':self.visit_if,
+            'While':self.visit_while,
+            'Until':self.visit_until,
+            'Parallel':self.visit_parallel,
+            'FuncCall':self.visit_funccall,
+        }
+        self.value_visitors = {
+            'Number':self.visit_number,
+            'Float':self.visit_float,
+            'Name':self.visit_name,
+            'Expression':self.visit_expression,
+            'FuncCall':self.visit_funccall,
+            'String':self.visit_string,
+            'Index':self.visit_index,
+        }
         
     def inc(self):
         self.i += 1
         return 1
 
+    def alloca(self,Type):
+        """
+        Allocates a stack slot, with hoist_allocas it is created in the
+        function's entry block so loops don't grow the stack and mem2reg
+        can promote it
+        """
+
+        if self.entry_builder is not None:
+            return self.entry_builder.alloca(Type)
+        return self.builder.alloca(Type)
+
+    def declare(self,name,return_type,param_types):
+        """Declares the function `name`, defined in another module"""
+
+        return_type = self.type_map[return_type]
+        fnty = ir.FunctionType(return_type,[self.type_map[x] for x in param_types])
+        func = ir.Function(self.module,fnty,name=self.symbols.get(name,name))
+        self.add_attributes(func,name)
+        self.globals[name] = func,return_type
+
+    def declare_slot(self,name,return_type,param_types,symbol):
+        """
+        Calls to the function `name` go through the function pointer
+        stored in the external global `symbol` (except its recursive
+        calls), so it can be replaced without recompiling its callers
+        """
+
+        return_type = self.type_map[return_type]
+        fnty = ir.FunctionType(return_type,[self.type_map[x] for x in param_types])
+        slot = ir.GlobalVariable(self.module,fnty.as_pointer(),name=symbol)
+        self.slots[name] = slot
+        self.globals[name] = slot,return_type
+
+    def function(self,branch):
+        """
+        The function a Def defines, declared the first time it's asked
+        for so functions can call the ones defined after them
+        """
+
+        name = branch.name
+        symbol = self.symbols.get(name,name)
+        func = self.module.globals.get(symbol)
+        if isinstance(func,ir.Function):
+            return func
+
+        params = branch.def_params
+        params = params if params[0] else []
+        return_type = self.type_map[branch.return_type]
+        fnty = ir.FunctionType(return_type,[self.type_map[x.type] for x in params])
+        func = ir.Function(self.module,fnty,name=symbol)
+        self.signatures[name] = branch.return_type,tuple(x.type for x in params)
+
+        # Like C's bool, so callers outside of the module (ctypes) can read the whole register
+        if return_type == self.type_map['bool']:
+            func.return_value.add_attribute('zeroext')
+        self.add_attributes(func,name)
+
+        # Calls to functions with a slot still load it (see visit_funccall)
+        self.globals[name] = func,return_type
+        return func
+
+    def add_attributes(self,func,name):
+        """Attributes the effects analysis found for the function"""
+
+        attributes = self.attributes.get(name,set())
+        if self.counters is not None or self.profiler is not None:
+            # Instrumented functions write their counters
+            attributes = attributes - {'readnone','readonly'}
+        for x in sorted(attributes):
+            if x in FunctionAttributes._known:
+                func.attributes.add(x)
+            else:
+                # llvmlite doesn't know the attributes newer than it, like willreturn
+                set.add(func.attributes,x)
+
     def compile(self,ast):
+        visitors = self.statement_visitors
+        if self.builder is None:
+            # The module's statements, not the body of a function, if or loop
+            defs = [x for x in ast if x.kind == 'Def']
+            for name,attributes in function_attributes(defs).items():
+                self.attributes.setdefault(name,attributes)
+
+            # Every function is declared before any is compiled
+            for branch in defs:
+                self.function(branch)
+
         for branch in ast:
-            # branch[0] holds the branch type (from the ast)
-            if branch[0] == 'VarAssign':
-                self.visit_assign(branch)
-            elif branch[0] == 'Def':
-                self.visit_def(branch)
-            elif branch[0] == 'Return':
-                self.visit_return(branch)
-            elif branch[0] == 'If':
-                self.visit_if(branch)
-            elif branch[0] == 'While':
-                self.visit_while(branch)
-            elif branch[0] == 'Until':
-                self.visit_until(branch)
-            elif branch[0] == 'FuncCall':
-                self.visit_funccall(branch)
+            # branch.kind holds the branch type (from the ast)
+            visit = visitors.get(branch.kind)
+            if visit is not None:
+                visit(branch)
                 
     def visit_def(self,branch):
-        name = branch[1]['name']
-        body = branch[1]['body']
-        params = branch[1]['def_params']
+        name = branch.name
+        body = branch.body
+        params = branch.def_params
         params = params if params[0] else []
 
         # Keep track of the name of each parameter
-        params_name = [x['name'] for x in params]
+        params_name = [x.name for x in params]
         
         # Keep track of the types of each parameter
-        params_type = [self.type_map[x['type']] for x in params]
+        params_type = [self.type_map[x.type] for x in params]
 
         # Functions return type
-        return_type = self.type_map[branch[1]['return']]
+        return_type = self.type_map[branch.return_type]
 
-        # Defining a funtions (return type,  parameters)
-        fnty = ir.FunctionType(return_type,params_type)
-        func = ir.Function(self.module,fnty,name=name)
+        # The function, declared by compile (return type,  parameters)
+        func = self.function(branch)
+        if func.blocks:
+            raise SyntaxError(f"Function '{name}' is defined more than once")
 
         # Defining function's block
         block = func.append_basic_block(f'{name}_entry')
 
         previous_builder = self.builder
+        previous_entry_builder = self.entry_builder
+        previous_loop_target = self.loop_target
+        previous_function_name = self.function_name
+        previous_profiling = self.function_counters,self.function_profile,self.branch_sites
+        previous_frame = self.profiler_frame
+        self.function_name = name
+
+        if self.hoist_allocas:
+            # The entry block only holds the function's allocas,
+            # the code goes in the body block it jumps to
+            self.entry_builder = ir.IRBuilder(block)
+            body_block = func.append_basic_block(f'{name}_body')
+            self.builder = ir.IRBuilder(body_block)
+        else:
+            self.entry_builder = None
+            self.builder = ir.IRBuilder(block)
 
-        # Current builder
-        self.builder = ir.IRBuilder(block)
+        self.start_profiling(branch,func)
+
+        # In the entry block, self tail calls jump back to the body
+        self.profiler_frame = self.profile_enter(name,self.entry_builder or self.builder)
 
         params_ptr = []
         
-        # Storing the pointers of each parameter
+        # Storing the pointers of each parameter, in the entry block
+        # so self tail calls can jump to the body with other values
         for i,typ in enumerate(params_type):
-            ptr = self.builder.alloca(typ)
-            self.builder.store(func.args[i],ptr)
+            ptr = self.alloca(typ)
+            (self.entry_builder or self.builder).store(func.args[i],ptr)
             params_ptr.append(ptr)
 
-        previous_variables = self.variables.copy()
+        self.loop_target = None
+        if self.entry_builder is not None:
+            self.loop_target = name,body_block,params_ptr
+
+        # The function's own scope, on top of the module's
+        previous_variables = self.variables
+        self.variables = self.globals.child()
         for i,x in enumerate(zip(params_type,params_name)):
             typ = params_type[i]
             ptr = params_ptr[i]
@@ -95,24 +358,115 @@ class Compiler:
             # Add function's parameter to stored variables
             self.variables[x[1]] = ptr,typ
 
-        # Adding function to variables
-        self.variables[name] = func,return_type
-
         # Compile the body of the function 
         self.compile(body)
 
-        # Removing the function's variables so it cannot be accessed by other functions
+        if self.entry_builder is not None:
+            self.entry_builder.branch(body_block)
+
+        # Leaving the function's scope so its variables cannot be accessed by other functions
         self.variables = previous_variables
-        self.variables[name] = func,return_type
 
         # Done with the function's builder
         # Return to the previous builder
         self.builder = previous_builder
-        
+        self.entry_builder = previous_entry_builder
+        self.loop_target = previous_loop_target
+        self.function_name = previous_function_name
+        self.function_counters,self.function_profile,self.branch_sites = previous_profiling
+        self.profiler_frame = previous_frame
+
+    def start_profiling(self,branch,func):
+        """Counters of the function being defined (and counts its entry) or its profile"""
+
+        self.function_counters = None
+        self.function_profile = None
+        self.branch_sites = 0
+        if self.counters is None and self.profile is None:
+            return
+
+        code_digest = digest(branch)
+        if self.counters is not None:
+            Type = ir.ArrayType(ir.IntType(64),count_sites(branch))
+            counters = ir.GlobalVariable(self.module,Type,name=f'gabby.profile.{func.name}')
+            counters.initializer = ir.Constant(Type,None)
+            sites = []
+            self.counters.functions[branch.name] = counters.name,code_digest,sites
+            self.function_counters = counters,sites
+            self.count(ir.Constant(ir.IntType(32),0))
+
+        if self.profile is not None:
+            self.function_profile = self.profile.function(branch.name,code_digest)
+            if self.function_profile is not None:
+                func.set_metadata('prof',self.module.add_metadata([
+                    ir.MetaDataString(self.module,'function_entry_count'),
+                    ir.Constant(ir.IntType(64),self.function_profile.entry)]))
+
+    def count(self,index):
+        """Increments the counter `index` of the current function"""
+
+        counters,_ = self.function_counters
+        ptr = self.builder.gep(counters,[ir.Constant(ir.IntType(32),0),index],inbounds=True)
+        self.builder.store(self.builder.add(self.builder.load(ptr),ir.Constant(ir.IntType(64),1)),ptr)
+
+    def next_counter(self,site):
+        """Index of the first counter of a new site, ('branch',) or ('call', callee)"""
+
+        _,sites = self.function_counters
+        index = 1 + sum(2 if x[0] == 'branch' else 1 for x in sites)
+        sites.append(site)
+        return index
+
+    def count_branch(self,test):
+        """
+        Counts which way the branch on `test` (i1) goes when instrumenting,
+        returns the branch's number, for weigh_branch
+        """
+
+        site = self.branch_sites
+        self.branch_sites += 1
+        if self.function_counters is not None:
+            index = ir.Constant(ir.IntType(32),self.next_counter(('branch',)))
+            self.count(self.builder.add(index,self.builder.zext(test,ir.IntType(32))))
+        return site
+
+    def weigh_branch(self,instr,site):
+        """Branch weights (!prof) of a conditional branch, from the function's profile"""
+
+        if self.function_profile is None:
+            return
+        weights = self.function_profile.branch_weights(site)
+        if weights is not None:
+            instr.set_metadata('prof',self.module.add_metadata([
+                ir.MetaDataString(self.module,'branch_weights'),
+                *[ir.Constant(ir.IntType(32),x) for x in weights]]))
+
+    def count_call(self,name):
+        if self.function_counters is not None:
+            self.count(ir.Constant(ir.IntType(32),self.next_counter(('call',name))))
+
+    def profile_enter(self,name,builder=None):
+        """Records a call of `name` when profiling, returns its frame for profile_exit (None if not profiling)"""
+
+        if self.profiler is None:
+            return None
+        if self.profiler_runtime is None:
+            self.profiler_runtime = ProfilerRuntime(self.module)
+        builder = builder or self.builder
+        function = ir.Constant(ir.IntType(32),self.profiler.function_id(name))
+        node = builder.call(self.profiler_runtime.enter,[function])
+        return node,builder.call(self.profiler_runtime.clock,[])
+
+    def profile_exit(self,frame):
+        if frame is not None:
+            self.builder.call(self.profiler_runtime.exit,list(frame))
+
     def visit_if(self,branch):
-        orelse = branch[1]['orelse']
-        body = branch[1]['body']
-        test,Type = self.visit_value(branch[1]['test'])
+        orelse = branch.orelse
+        body = branch.body
+        test,Type = self.visit_value(branch.test)
+        site = self.count_branch(test)
+        block = self.builder.block
         
         # If there is no else block
         if orelse == []:
@@ -135,41 +489,37 @@ class Compiler:
               with otherwise:
                   # Runs this if false
                   self.compile(orelse)
+
+        self.weigh_branch(block.terminator,site)
                   
     def visit_value(self,branch):
-        if branch[0] == 'Number':
-            value,Type = branch[1]['value'],self.type_map['int']
-            return ir.Constant(Type,value),Type
-        
-        elif branch[0] == 'Float':
-            value,Type = branch[1]['value'],self.type_map['float']
-            return ir.Constant(Type,value),Type
-        
-        elif branch[0] == 'Name':
-            ptr,Type = self.variables[branch[1]['value']]  
-            return self.builder.load(ptr),Type
-        
-        elif branch[0] == 'Expression':
-            return self.visit_expression(branch)
-        
-        elif branch[0] == 'FuncCall':
-                return self.visit_funccall(branch)
-            
-        elif branch[0] == 'String':
-            value = branch[1]['value']
-            string,Type = self.strings(value)
-            return string, Type
+        return self.value_visitors[branch.kind](branch)
+
+    def visit_number(self,branch):
+        Type = self.type_map['int']
+        return ir.Constant(Type,branch.value),Type
+
+    def visit_float(self,branch):
+        Type = self.type_map['float']
+        return ir.Constant(Type,branch.value),Type
+
+    def visit_name(self,branch):
+        ptr,Type = self.variables[branch.value]
+        return self.builder.load(ptr),Type
+
+    def visit_string(self,branch):
+        return self.intern_string(branch.value)
         
     def visit_assign(self,branch):
-        name = branch[1]['name']
-        value = branch[1]['value']
+        name = branch.name
+        value = branch.value
 
         # Getting the value and it's type
         value,Type = self.visit_value(value)
 
         if not self.variables.__contains__(name):
             # Creating a pointer for the type 'Type' : ir.Type
-            ptr = self.builder.alloca(Type)
+            ptr = self.alloca(Type)
 
             # Storing the value to the pointer
             self.builder.store(value,ptr)
@@ -181,6 +531,36 @@ class Compiler:
             ptr,_ = self.variables[name]
             self.builder.store(value,ptr)
         
+    def element(self,name,index):
+        """Pointer to the element `index` of the array `name` and the element's type"""
+
+        ptr,Type = self.variables[name]
+        array = self.builder.load(ptr)
+        index,_ = self.visit_value(index)
+        return self.builder.gep(array,[index],inbounds=True),Type.pointee
+
+    def visit_index(self,branch):
+        ptr,Type = self.variables[branch.name]
+        if isinstance(Type,ir.VectorType):
+            # A lane of a vector
+            index,_ = self.visit_value(branch.index)
+            return self.builder.extract_element(self.builder.load(ptr),index),Type.element
+
+        ptr,Type = self.element(branch.name,branch.index)
+        return self.builder.load(ptr),Type
+
+    def visit_index_assign(self,branch):
+        ptr,Type = self.variables[branch.name]
+        if isinstance(Type,ir.VectorType):
+            index,_ = self.visit_value(branch.index)
+            value,_ = self.visit_value(branch.value)
+            self.builder.store(self.builder.insert_element(self.builder.load(ptr),value,index),ptr)
+            return
+
+        ptr,_ = self.element(branch.name,branch.index)
+        value,_ = self.visit_value(branch.value)
+        self.builder.store(value,ptr)
+
     def strings(self,string):
         """Strings are converted to an array of characters"""
         
@@ -191,24 +571,109 @@ class Compiler:
         buf[-1] = 0
         buf[:-1] = string.encode('utf8')
         return ir.Constant(ir.ArrayType(ir.IntType(8), n), buf),ir.ArrayType(ir.IntType(8), n)
+
+    def intern_string(self,string):
+        """
+        Every distinct string literal is emitted once, as a private
+        constant global, and used through a pointer to its first character
+        """
+
+        string,_ = self.strings(string)
+        return self.intern_bytes(bytes(string.constant)),ir.IntType(8).as_pointer()
+
+    def intern_bytes(self,data):
+        """Pointer to the first byte of a private constant global holding `data`"""
+
+        if data not in self.string_constants:
+            zero = ir.Constant(ir.IntType(32),0)
+            Type = ir.ArrayType(ir.IntType(8),len(data))
+            glob = ir.GlobalVariable(self.module, Type, name=self.module.get_unique_name('str'))
+            glob.linkage = 'private'
+            glob.unnamed_addr = True
+            glob.global_constant = True
+            glob.initializer = ir.Constant(Type,bytearray(data))
+            self.string_constants[data] = glob.gep([zero, zero])
+
+        return self.string_constants[data]
     
-    def printf(self,params,Type):
+    def printf(self,params,types):
         """C builtin Printf function"""
         
-        format = params[0]
-        params = params[1:]
-        zero = ir.Constant(ir.IntType(32),0)
-        ptr = self.builder.alloca(Type)
-        self.builder.store(format,ptr)
-        format = ptr
-        format = self.builder.gep(format, [zero, zero])
-        format = self.builder.bitcast(format, ir.IntType(8).as_pointer())
         func,_ = self.variables['printf']
-        return self.builder.call(func,[format,*params])
+        if not self.buffered_output and not self.unbuffered_output:
+            return self.builder.call(func,params)
+
+        # Formatted by snprintf, so the text goes where the rest of the output goes
+        params = [self.vararg(value,Type) for value,Type in zip(params,types)]
+        if self.unbuffered_output:
+            return self.output_runtime().unbuffered_printf(self.builder,params)
+        return self.output_runtime().printf(self.builder,params)
+
+    def vararg(self,value,Type):
+        """value as C passes it to a variadic function: floats as doubles, narrower ints as ints"""
+
+        if isinstance(Type,ir.FloatType):
+            return self.builder.fpext(value,ir.DoubleType())
+        if isinstance(Type,ir.IntType) and Type.width == 1:
+            # A bool is 0 or 1, not 0 or -1
+            return self.builder.zext(value,ir.IntType(32))
+        if isinstance(Type,ir.IntType) and Type.width < 32:
+            return self.builder.sext(value,ir.IntType(32))
+        return value
+
+    def output_runtime(self):
+        if self.output is None:
+            self.output = OutputRuntime(self.module)
+        return self.output
+
+    def buffered_printf(self,branch,args,types):
+        """
+        printf with a literal format that only has %i (%d) and %f
+        conversions, written to the output buffer without formatting at
+        run time. Returns None for any other printf, which snprintf
+        formats (see printf)
+        """
+
+        format = branch.params[0]
+        if format is None or format.kind != 'String':
+            return None
+
+        # Up to the first NUL, like printf
+        data,_ = self.strings(format.value)
+        data = bytes(data.constant).split(b'\0')[0]
+        parts = parse_format(data)
+        if parts is None or len([x for x in parts if isinstance(x,str)]) != len(args) - 1:
+            return None
+
+        values = []
+        for part,value,Type in zip([x for x in parts if isinstance(x,str)],args[1:],types[1:]):
+            if part == 'i' and isinstance(Type,ir.IntType) and Type.width <= 32:
+                values.append(self.vararg(value,Type))
+            elif part == 'f' and isinstance(Type,(ir.FloatType,ir.DoubleType)):
+                values.append(self.vararg(value,Type))
+            else:
+                return None
+
+        output = self.output_runtime()
+        written = ir.Constant(ir.IntType(32),0)
+        values = iter(values)
+        for part in parts:
+            if part == 'i':
+                n = self.builder.call(output.write_int,[next(values)])
+            elif part == 'f':
+                n = self.builder.call(output.write_float,[next(values)])
+            elif len(part) == 1:
+                self.builder.call(output.write_char,[ir.Constant(ir.IntType(8),part[0])])
+                n = ir.Constant(ir.IntType(32),1)
+            else:
+                self.builder.call(output.write,[self.intern_bytes(part),ir.Constant(ir.IntType(32),len(part))])
+                n = ir.Constant(ir.IntType(32),len(part))
+            written = self.builder.add(written,n)
+        return written
     
-    def visit_funccall(self,branch):
-        name = branch[1]['name']
-        params = branch[1]['params']
+    def visit_funccall(self,branch,tail=False):
+        name = branch.name
+        params = branch.params
 
         args = []
         types = []
@@ -219,17 +684,96 @@ class Compiler:
                 types.append(_)
 
         if name == 'printf':
-            ret = self.printf(args,types[0])
+            frame = self.profile_enter('printf')
+            ret = None
+            if self.buffered_output:
+                ret = self.buffered_printf(branch,args,types)
+            if ret is None:
+                ret = self.printf(args,types)
+            self.profile_exit(frame)
             ret_type = self.type_map['int']
+        elif name not in self.globals and (name in VECTOR_TYPES or name in VECTOR_BUILTINS):
+            ret,ret_type = self.vector_builtin(name,args,types)
         else:
+            self.count_call(name)
             func,ret_type = self.variables[name]
-            ret = self.builder.call(func,args)
+            slot = self.slots.get(name)
+            if slot is not None and func is not self.builder.function:
+                func = self.builder.load(slot)
+            if tail:
+                # musttail guarantees the call reuses the caller's frame,
+                # which requires both functions to have the same prototype.
+                # The call wouldn't repeat the zeroext of bool returns, those are only tail
+                caller = self.builder.function
+                if isinstance(func,ir.Function) and func.function_type == caller.function_type \
+                        and not func.return_value.attributes and not caller.return_value.attributes:
+                    tail = 'musttail'
+                # The caller's frame is gone before the callee runs
+                self.profile_exit(self.profiler_frame)
+            ret = self.builder.call(func,args,tail=tail)
 
         return ret, ret_type
     
+    def vector_builtin(self,name,args,types):
+        """
+        Vector constructors, float4(x) (x in every lane), float4(a, b, c, d)
+        and float4(array, i) (array[i] to array[i + 3]), and the vector
+        functions: store(array, i, vector), select(mask, a, b), sum, product,
+        min, max (of the lanes of a vector, or lane wise of two vectors)
+        and any, all (of the lanes of a mask)
+        """
+
+        int32 = ir.IntType(32)
+        if name in VECTOR_TYPES:
+            Type = self.type_map[name]
+            element = Type.element
+            if types == [element]:
+                return vectors.splat(self.builder,args[0],Type),Type
+            if types == [element] * Type.count:
+                return vectors.build(self.builder,args,Type),Type
+            if types == [element.as_pointer(),int32]:
+                return vectors.load(self.builder,self.builder.gep(args[0],[args[1]],inbounds=True),Type),Type
+            raise TypeError(f"{name}() takes a {VECTOR_TYPES[name][0]}, {Type.count} of them, "
+                            f"or an array and an index, not ({', '.join(map(str,types))})")
+
+        vector = types[0] if types else None
+        if name == 'store':
+            if len(types) != 3 or not isinstance(types[2],ir.VectorType) or types[:2] != [types[2].element.as_pointer(),int32]:
+                raise TypeError('store() takes an array, an index and a vector of the elements of the array')
+            vectors.store(self.builder,args[2],self.builder.gep(args[0],[args[1]],inbounds=True))
+            return None,ir.VoidType()
+
+        if name == 'select':
+            if len(types) != 3 or types[1] != types[2] or not (types[0] == ir.IntType(1) or (
+                    is_mask(types[0]) and isinstance(types[1],ir.VectorType) and types[0].count == types[1].count)):
+                raise TypeError('select() takes a mask (or a bool) and two values of the same type')
+            return self.builder.select(*args),types[1]
+
+        if name in ('min','max'):
+            combine = vectors.minimum if name == 'min' else vectors.maximum
+            if len(types) == 1 and isinstance(vector,ir.VectorType) and not is_mask(vector):
+                return vectors.reduce(self.builder,args[0],combine),vector.element
+            if len(types) == 2 and types[0] == types[1] and isinstance(vector,(ir.IntType,ir.FloatType,ir.VectorType)) \
+                    and not is_mask(vector) and vector != ir.IntType(1):
+                return combine(self.builder,*args),vector
+            raise TypeError(f'{name}() takes a vector, or two values of the same type')
+
+        if name in ('sum','product'):
+            if len(types) != 1 or not isinstance(vector,ir.VectorType) or is_mask(vector):
+                raise TypeError(f'{name}() takes a vector')
+            ops = FLOAT_OPS if isinstance(vector.element,ir.FloatType) else INT_OPS
+            op = ops['+' if name == 'sum' else '*']
+            return vectors.reduce(self.builder,args[0],op),vector.element
+
+        # any, all
+        if len(types) != 1 or not is_mask(vector):
+            raise TypeError(f'{name}() takes a mask')
+        op = ir.IRBuilder.or_ if name == 'any' else ir.IRBuilder.and_
+        return vectors.reduce(self.builder,args[0],op),ir.IntType(1)
+
     def visit_while(self,branch):
-        Test = branch[1]['test']
-        body = branch[1]['body']
+        Test = branch.test
+        body = branch.body
         test,_ = self.visit_value(Test)
 
         # Entry (block where that runs if the condition is true)
@@ -245,18 +789,20 @@ class Compiler:
         #       /   \
         #      /     \
         # true block  false block
-        self.builder.cbranch(test, while_loop_entry, while_loop_otherwise)
+        site = self.count_branch(test)
+        self.weigh_branch(self.builder.cbranch(test, while_loop_entry, while_loop_otherwise),site)
 
         # Setting the builder position-at-start
         self.builder.position_at_start(while_loop_entry)
         self.compile(body)
         test,_ = self.visit_value(Test)
-        self.builder.cbranch(test, while_loop_entry, while_loop_otherwise)
+        site = self.count_branch(test)
+        self.weigh_branch(self.builder.cbranch(test, while_loop_entry, while_loop_otherwise),site)
         self.builder.position_at_start(while_loop_otherwise)
     
     def visit_until(self,branch):
-        Test = branch[1]['test']
-        body = branch[1]['body']
+        Test = branch.test
+        body = branch.body
         test,_ = self.visit_value(Test)
         test = self.builder.not_(test)
 
@@ -273,103 +819,309 @@ class Compiler:
         #       /   \
         #      /     \
         # true block  false block
-        self.builder.cbranch(test, until_loop_entry, until_loop_otherwise)
+        site = self.count_branch(test)
+        self.weigh_branch(self.builder.cbranch(test, until_loop_entry, until_loop_otherwise),site)
 
         # Setting the builder position-at-start
         self.builder.position_at_start(until_loop_entry)
         self.compile(body)
         test,_ = self.visit_value(Test)
         test = self.builder.not_(test)
-        self.builder.cbranch(test, until_loop_entry, until_loop_otherwise)
+        site = self.count_branch(test)
+        self.weigh_branch(self.builder.cbranch(test, until_loop_entry, until_loop_otherwise),site)
         self.builder.position_at_start(until_loop_otherwise)
     
+    def for_range(self,lo,hi,body):
+        """Loop of i from lo to hi (excluded, i32 values), body(i) emits the code of an iteration"""
+
+        one = ir.Constant(ir.IntType(32),1)
+        index = self.alloca(ir.IntType(32))
+        self.builder.store(lo,index)
+
+        loop = self.builder.append_basic_block("range_loop"+str(self.inc()))
+        done = self.builder.append_basic_block("range_done"+str(self.i))
+        self.builder.cbranch(self.builder.icmp_signed('<',lo,hi),loop,done)
+
+        self.builder.position_at_end(loop)
+        body(self.builder.load(index))
+        index_next = self.builder.add(self.builder.load(index),one)
+        self.builder.store(index_next,index)
+        self.builder.cbranch(self.builder.icmp_signed('<',index_next,hi),loop,done)
+        self.builder.position_at_end(done)
+
+    def visit_parallel(self,branch):
+        """
+        The body is outlined in a function ParallelRuntime runs on several
+        threads, each one going through part of [start, end): contiguous
+        blocks of the range (static), chunks of `chunk` iterations dealt
+        in turn (static with a chunk) or taken by whichever thread is
+        free (dynamic). The variables of the function the body uses are
+        copied to every thread, assigning them in the body doesn't change
+        them after the loop. Reduction variables start at 0 (+) or 1 (*)
+        in every thread and each thread's result is combined with the
+        variable's value after the loop, in thread order
+        """
+
+        int32 = ir.IntType(32)
+        int64 = ir.IntType(64)
+        zero = ir.Constant(int32,0)
+
+        names = parallel_body_names(branch.body)
+        reductions = []
+        for op,name in branch.reductions:
+            ptr,Type = self.variables[name]
+            if not isinstance(Type,(ir.IntType,ir.FloatType,ir.DoubleType)) or Type == ir.IntType(1):
+                raise TypeError(f"Can't reduce {name} of type '{Type}' with {op}")
+            reductions.append((op,name,ptr,Type))
+        reduced = {x[1] for x in reductions}
+        captured = [(name,)+self.variables[name] for name in sorted(names)
+                    if name in self.variables and name not in reduced and name != branch.name
+                    and isinstance(self.variables[name][0],ir.AllocaInstr)]
+
+        start,_ = self.visit_value(branch.start)
+        end,_ = self.visit_value(branch.end)
+        if branch.chunk is not None:
+            chunk,_ = self.visit_value(branch.chunk)
+            chunk = self.builder.select(self.builder.icmp_signed('<',chunk,ir.Constant(int32,1)),ir.Constant(int32,1),chunk)
+        else:
+            chunk = ir.Constant(int32,1 if branch.schedule == 'dynamic' else 0)
+
+        # Context the outlined body gets: next iteration to hand out (dynamic), start,
+        # end, chunk, a pointer to the per thread results of each reduction, captured values
+        partial_types = [ir.ArrayType(x[3],MAX_THREADS) for x in reductions]
+        context_type = ir.LiteralStructType([int64,int32,int32,int32]
+                                            + [x.as_pointer() for x in partial_types]
+                                            + [x[2] for x in captured])
+        context = self.alloca(context_type)
+        partials = [self.alloca(x) for x in partial_types]
+        field = lambda i: self.builder.gep(context,[zero,ir.Constant(int32,i)])
+
+        values = [self.builder.sext(start,int64),start,end,chunk] + partials \
+            + [self.builder.load(x[1]) for x in captured]
+        for i,value in enumerate(values):
+            self.builder.store(value,field(i))
+
+        task = self.outline_parallel(branch,context_type,reductions,captured)
+
+        # Units of work: iterations, or chunks when the range is split in chunks
+        size = self.builder.sub(self.builder.sext(end,int64),self.builder.sext(start,int64))
+        size = self.builder.select(self.builder.icmp_signed('<',size,ir.Constant(int64,0)),ir.Constant(int64,0),size)
+        if branch.chunk is not None or branch.schedule == 'dynamic':
+            chunk64 = self.builder.sext(chunk,int64)
+            size = self.builder.sdiv(self.builder.add(size,self.builder.sub(chunk64,ir.Constant(int64,1))),chunk64)
+        units = self.builder.select(self.builder.icmp_signed('<',size,ir.Constant(int64,MAX_THREADS)),
+                                    size,ir.Constant(int64,MAX_THREADS))
+
+        if self.buffered_output:
+            self.builder.call(self.output_runtime().flush,[])
+        frame = self.profile_enter(task.name)
+        if frame is not None:
+            # The tree isn't shared by threads, the calls made by the loop's body aren't recorded
+            self.builder.atomic_rmw('add',self.profiler_runtime.paused,ir.Constant(int32,1),'seq_cst')
+        threads = self.builder.call(self.parallel_runtime().run,
+                                    [task,self.builder.bitcast(context,ir.IntType(8).as_pointer()),self.builder.trunc(units,int32)])
+        if frame is not None:
+            self.builder.atomic_rmw('sub',self.profiler_runtime.paused,ir.Constant(int32,1),'seq_cst')
+            self.profile_exit(frame)
+
+        for (op,name,ptr,Type),partial in zip(reductions,partials):
+            ops = INT_OPS if isinstance(Type,ir.IntType) else FLOAT_OPS
+            def combine(thread):
+                value = self.builder.load(self.builder.gep(partial,[zero,thread]))
+                self.builder.store(ops[op](self.builder,self.builder.load(ptr),value),ptr)
+            self.for_range(zero,threads,combine)
+
+    def parallel_runtime(self):
+        if self.parallel is None:
+            self.parallel = ParallelRuntime(self.module)
+        return self.parallel
+
+    def outline_parallel(self,branch,context_type,reductions,captured):
+        """The function running the share of thread `thread` of `threads` of a parallel loop"""
+
+        int32 = ir.IntType(32)
+        int64 = ir.IntType(64)
+        zero = ir.Constant(int32,0)
+
+        func = ir.Function(self.module,TASK,name=self.module.get_unique_name(f'{self.builder.function.name}.parallel'))
+        func.linkage = 'internal'
+
+        previous = (self.builder,self.entry_builder,self.variables,self.loop_target,
+                    self.function_name,self.buffered_output,self.unbuffered_output)
+
+        block = func.append_basic_block('parallel_entry')
+        if self.hoist_allocas:
+            self.entry_builder = ir.IRBuilder(block)
+            body_block = func.append_basic_block('parallel_body')
+            self.builder = ir.IRBuilder(body_block)
+        else:
+            self.entry_builder = None
+            self.builder = ir.IRBuilder(block)
+
+        # The body can't return, and threads can't share the output buffer
+        self.loop_target = None
+        self.function_name = None
+        self.unbuffered_output = self.buffered_output
+        self.buffered_output = False
+
+        context = self.builder.bitcast(func.args[0],context_type.as_pointer())
+        thread,threads = func.args[1:]
+        field = lambda i: self.builder.load(self.builder.gep(context,[zero,ir.Constant(int32,i)]))
+
+        # Variables of the enclosing function are replaced by the thread's copies
+        self.variables = self.globals.child()
+        for i,(name,_,Type) in enumerate(captured):
+            ptr = self.alloca(Type)
+            self.builder.store(field(4 + len(reductions) + i),ptr)
+            self.variables[name] = ptr,Type
+        accumulators = []
+        for op,name,_,Type in reductions:
+            ptr = self.alloca(Type)
+            self.builder.store(ir.Constant(Type,REDUCTION_IDENTITY[op]),ptr)
+            self.variables[name] = ptr,Type
+            accumulators.append(ptr)
+        counter = self.alloca(int32)
+        self.variables[branch.name] = counter,int32
+
+        def iteration(i):
+            self.builder.store(i,counter)
+            self.compile(branch.body)
+
+        start = field(1)
+        end = field(2)
+        chunk = self.builder.sext(field(3),int64)
+        start64 = self.builder.sext(start,int64)
+        end64 = self.builder.sext(end,int64)
+        min64 = lambda a,b: self.builder.select(self.builder.icmp_signed('<',a,b),a,b)
+
+        if branch.schedule == 'static' and branch.chunk is None:
+            # Contiguous blocks of the same size (give or take one)
+            size = self.builder.sub(end64,start64)
+            lo = self.builder.add(start64,self.builder.sdiv(self.builder.mul(size,self.builder.sext(thread,int64)),
+                                                            self.builder.sext(threads,int64)))
+            hi = self.builder.add(start64,self.builder.sdiv(self.builder.mul(size,self.builder.sext(self.builder.add(thread,ir.Constant(int32,1)),int64)),
+                                                            self.builder.sext(threads,int64)))
+            self.for_range(self.builder.trunc(lo,int32),self.builder.trunc(hi,int32),iteration)
+        else:
+            base = self.alloca(int64)
+            if branch.schedule == 'static':
+                # Chunk number thread, thread + threads, thread + 2 * threads...
+                self.builder.store(self.builder.add(start64,self.builder.mul(chunk,self.builder.sext(thread,int64))),base)
+                step = self.builder.mul(chunk,self.builder.sext(threads,int64))
+
+            test = self.builder.append_basic_block("parallel_chunk"+str(self.inc()))
+            body = self.builder.append_basic_block("parallel_chunk_body"+str(self.i))
+            done = self.builder.append_basic_block("parallel_chunk_done"+str(self.i))
+            self.builder.branch(test)
+
+            self.builder.position_at_end(test)
+            if branch.schedule == 'static':
+                lo = self.builder.load(base)
+            else:
+                # Takes the next chunk
+                lo = self.builder.atomic_rmw('add',self.builder.gep(context,[zero,zero]),chunk,'monotonic')
+            self.builder.cbranch(self.builder.icmp_signed('<',lo,end64),body,done)
+
+            self.builder.position_at_end(body)
+            hi = min64(self.builder.add(lo,chunk),end64)
+            self.for_range(self.builder.trunc(lo,int32),self.builder.trunc(hi,int32),iteration)
+            if branch.schedule == 'static':
+                self.builder.store(self.builder.add(lo,step),base)
+            self.builder.branch(test)
+            self.builder.position_at_end(done)
+
+        for i,ptr in enumerate(accumulators):
+            partial = self.builder.gep(field(4 + i),[zero,thread])
+            self.builder.store(self.builder.load(ptr),partial)
+        self.builder.ret_void()
+
+        if self.entry_builder is not None:
+            self.entry_builder.branch(body_block)
+
+        (self.builder,self.entry_builder,self.variables,self.loop_target,
+         self.function_name,self.buffered_output,self.unbuffered_output) = previous
+        return func
 
     def visit_return(self,branch):
-        value = branch[1]['value']
-        value,Type = self.visit_value(value)
+        value = branch.value
+        if self.buffered_output and self.function_name == 'main':
+            # The program is done, write out what's left in the buffer
+            value,Type = self.visit_value(value)
+            self.profile_exit(self.profiler_frame)
+            self.builder.call(self.output_runtime().flush,[])
+            self.builder.ret(value)
+            return
+
+        if self.tail_calls and value.kind == 'FuncCall' and value.name != 'printf' and value.name in self.globals:
+            if self.loop_target is not None and value.name == self.loop_target[0]:
+                self.self_tail_call(value)
+                return
+            value,Type = self.visit_funccall(value,tail=True)
+        else:
+            value,Type = self.visit_value(value)
+            self.profile_exit(self.profiler_frame)
         self.builder.ret(value)
 
+    def self_tail_call(self,branch):
+        """`return f(...)` in f, the arguments replace the parameters and the body runs again"""
+
+        _,body_block,params_ptr = self.loop_target
+        params = branch.params
+        # Every argument is evaluated before any parameter changes
+        args = [self.visit_value(x)[0] for x in params] if params[0] else []
+        for arg,ptr in zip(args,params_ptr):
+            self.builder.store(arg,ptr)
+        self.builder.branch(body_block)
+
     def visit_expression(self,branch):
-        op = branch[1]['op']
-        lhs, lhs_type = self.visit_value(branch[1]['lhs'])
-        rhs, rhs_type = self.visit_value(branch[1]['rhs'])
+        op = branch.op
+        lhs, lhs_type = self.visit_value(branch.lhs)
+        rhs, rhs_type = self.visit_value(branch.rhs)
+
+        if isinstance(lhs_type,ir.VectorType) or isinstance(rhs_type,ir.VectorType):
+            return self.vector_expression(op,lhs,lhs_type,rhs,rhs_type)
 
         if isinstance(rhs_type,ir.FloatType) and isinstance(lhs_type,ir.FloatType):
-            Type = ir.FloatType()
-            if op == '+':
-                value = self.builder.fadd(lhs,rhs)
-            elif op == '*':
-                value = self.builder.fmul(lhs,rhs)
-            elif op == '/':
-                 value = self.builder.fdiv(lhs,rhs)
-            elif op == '%':
-                 value = self.builder.frem(lhs,rhs)
-            elif op == '-':
-                 value = self.builder.fsub(lhs,rhs)
-            elif op == '<':
-                value = self.builder.fcmp_ordered('<',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '<=':
-                value = self.builder.fcmp_ordered('<=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '>':
-                value = self.builder.fcmp_ordered('>',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '>=':
-                value = self.builder.fcmp_ordered('>=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '!=':
-                value = self.builder.fcmp_ordered('!=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '==':
-                value = self.builder.fcmp_ordered('==',lhs,rhs)
-                Type = ir.IntType(1)
-        
+            if op in COMPARISONS:
+                return self.builder.fcmp_ordered(op,lhs,rhs),ir.IntType(1)
+            return FLOAT_OPS[op](self.builder,lhs,rhs),ir.FloatType()
+
         elif isinstance(rhs_type,ir.IntType) and isinstance(lhs_type,ir.IntType):
-            Type = ir.IntType(32)
-            if op == '+':
-                value = self.builder.add(lhs,rhs)
-            elif op == '*':
-                value = self.builder.mul(lhs,rhs)
-            elif op == '/':
-                value = self.builder.sdiv(lhs,rhs)
-            elif op == '%':
-                value = self.builder.srem(lhs,rhs)
-            elif op == '-':
-                value = self.builder.sub(lhs,rhs)
-            elif op == '<':
-                value = self.builder.icmp_signed('<',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '<=':
-                value = self.builder.icmp_signed('<=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '>':
-                value = self.builder.icmp_signed('>',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '>=':
-                value = self.builder.icmp_signed('>=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '!=':
-                value = self.builder.icmp_signed('!=',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '==':
-                value = self.builder.icmp_signed('==',lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '&':
-                value = self.builder.and_(lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '|':
-                value = self.builder.or_(lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '^':
-                value = self.builder.xor(lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '>>':
-                value = self.builder.ashr(lhs,rhs)
-                Type = ir.IntType(1)
-            elif op == '<<':
-                value = self.builder.shl(lhs,rhs)
-                Type = ir.IntType(1)
-            
-                
-        return value,Type
\ No newline at end of file
+            if op in COMPARISONS:
+                return self.builder.icmp_signed(op,lhs,rhs),ir.IntType(1)
+            if op in BITWISE_OPS:
+                return BITWISE_OPS[op](self.builder,lhs,rhs),lhs_type
+            return INT_OPS[op](self.builder,lhs,rhs),ir.IntType(32)
+
+        raise TypeError(f"Unsupported operand types for {op}: '{lhs_type}' and '{rhs_type}'")
+
+    def vector_expression(self,op,lhs,lhs_type,rhs,rhs_type):
+        """Lane wise operations, a scalar operand is used in every lane, comparisons give masks"""
+
+        if isinstance(rhs_type,ir.VectorType) and lhs_type == rhs_type.element:
+            lhs,lhs_type = vectors.splat(self.builder,lhs,rhs_type),rhs_type
+        elif isinstance(lhs_type,ir.VectorType) and rhs_type == lhs_type.element:
+            rhs,rhs_type = vectors.splat(self.builder,rhs,lhs_type),lhs_type
+
+        if lhs_type == rhs_type:
+            element = lhs_type.element
+            mask = ir.VectorType(ir.IntType(1),lhs_type.count)
+            if isinstance(element,ir.FloatType):
+                if op in COMPARISONS:
+                    return self.builder.fcmp_ordered(op,lhs,rhs),mask
+                if op in FLOAT_OPS:
+                    return FLOAT_OPS[op](self.builder,lhs,rhs),lhs_type
+            elif element == ir.IntType(1):
+                # Masks
+                if op in ('&','|','^'):
+                    return BITWISE_OPS[op](self.builder,lhs,rhs),lhs_type
+                if op in ('==','!='):
+                    return self.builder.icmp_unsigned(op,lhs,rhs),mask
+            else:
+                if op in COMPARISONS:
+                    return self.builder.icmp_signed(op,lhs,rhs),mask
+                if op in BITWISE_OPS:
+                    return BITWISE_OPS[op](self.builder,lhs,rhs),lhs_type
+                return INT_OPS[op](self.builder,lhs,rhs),lhs_type
+
+        raise TypeError(f"Unsupported operand types for {op}: '{lhs_type}' and '{rhs_type}'")
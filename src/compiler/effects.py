@@ -0,0 +1,143 @@
+from src.compiler.vectors import VECTOR_BUILTINS, VECTOR_TYPES
+from src.pparser.nodes import Node
+
+from collections import defaultdict
+
+
+# What a function does to memory other than its own locals, each one includes the previous
+NO_MEMORY, READS_MEMORY, WRITES_MEMORY = range(3)
+
+# Leaf functions of up to this many AST nodes are always inlined
+INLINE_NODES = 24
+
+class FunctionEffects:
+    """What the body of a Def does by itself, without the functions it calls"""
+
+    __slots__ = ('memory', 'loops', 'callees', 'external', 'size')
+
+    def __init__(self, defn, functions):
+        self.memory = NO_MEMORY
+        self.loops = False
+        # Functions of the program it calls, and whether it calls functions defined elsewhere
+        self.callees = set()
+        self.external = False
+        self.size = 0
+
+        # Parameters that aren't arrays, indexing them reads a vector's lane
+        params = defn.def_params if defn.def_params[0] else []
+        scalars = {x.name for x in params if not x.type.endswith('[]')}
+
+        stack = [defn.body]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+                continue
+            if not isinstance(node, Node):
+                continue
+            self.size += 1
+            stack.extend(node.children())
+
+            kind = node.kind
+            if kind == 'IndexAssign' and node.name not in scalars:
+                # Writes an array
+                self.memory = WRITES_MEMORY
+            elif kind == 'Parallel':
+                # Runs threads
+                self.memory = WRITES_MEMORY
+                self.loops = True
+            elif kind in ('While', 'Until'):
+                self.loops = True
+            elif kind == 'Index' and node.name not in scalars:
+                # An array element, or the lane of a local vector which can't be told apart here
+                self.memory = max(self.memory, READS_MEMORY)
+            elif kind == 'FuncCall':
+                name = node.name
+                if name in functions:
+                    self.callees.add(name)
+                elif name == 'printf' or name == 'store':
+                    self.memory = WRITES_MEMORY
+                elif name in VECTOR_TYPES:
+                    params = node.params if node.params[0] else []
+                    if len(params) == 2:
+                        # float4(array, i)
+                        self.memory = max(self.memory, READS_MEMORY)
+                elif name not in VECTOR_BUILTINS:
+                    # Defined somewhere else, nothing is known about it
+                    self.memory = WRITES_MEMORY
+                    self.loops = True
+                    self.external = True
+
+def bottom_up(effects, ok):
+    """
+    Functions for which ok(name) holds and that only call such
+    functions, without reaching a cycle of the call graph: a function is
+    added once everything it calls has been
+    """
+
+    callers = defaultdict(list)
+    pending = {}
+    for name, x in effects.items():
+        pending[name] = len(x.callees)
+        for callee in x.callees:
+            callers[callee].append(name)
+
+    result = set()
+    ready = [name for name, n in pending.items() if n == 0 and ok(name)]
+    while ready:
+        name = ready.pop()
+        result.add(name)
+        for caller in callers[name]:
+            pending[caller] -= 1
+            if pending[caller] == 0 and ok(caller):
+                ready.append(caller)
+    return result
+
+def function_attributes(defs):
+    """
+    LLVM attributes of the functions the Defs define, by name: nounwind
+    for every function (nothing unwinds), readnone or readonly for the
+    functions that (with everything they call) don't touch memory or only
+    read it, norecurse and willreturn for the ones that provably don't
+    recurse, and also provably return (no loops), and alwaysinline for
+    small leaf functions. main flushes the output buffer, it's never readnone
+    """
+
+    functions = {x.name for x in defs}
+    effects = {x.name:FunctionEffects(x, functions) for x in defs}
+    if 'main' in effects:
+        effects['main'].memory = WRITES_MEMORY
+
+    # A function's memory effects are the worst of its own and its callees',
+    # raised until nothing changes (recursive functions included)
+    memory = {name:x.memory for name, x in effects.items()}
+    callers = defaultdict(list)
+    for name, x in effects.items():
+        for callee in x.callees:
+            callers[callee].append(name)
+    work = list(effects)
+    while work:
+        name = work.pop()
+        for caller in callers[name]:
+            if memory[caller] < memory[name]:
+                memory[caller] = memory[name]
+                work.append(caller)
+
+    norecurse = bottom_up(effects, lambda name: not effects[name].external)
+    willreturn = bottom_up(effects, lambda name: not effects[name].loops)
+
+    attributes = {}
+    for name, x in effects.items():
+        attrs = {'nounwind'}
+        if memory[name] == NO_MEMORY:
+            attrs.add('readnone')
+        elif memory[name] == READS_MEMORY:
+            attrs.add('readonly')
+        if name in norecurse:
+            attrs.add('norecurse')
+        if name in willreturn:
+            attrs.add('willreturn')
+        if not x.callees and not x.external and x.size <= INLINE_NODES and name != 'main':
+            attrs.add('alwaysinline')
+        attributes[name] = attrs
+    return attributes
@@ -0,0 +1,156 @@
+from src.pparser.nodes import Node
+
+import re
+
+
+# Label of a basic block at the start of a line of a function's IR
+BLOCK_LABEL = re.compile(r'^("(?:[^"\\]|\\.)+"|[-\w.$]+):')
+LABEL = re.compile(r'label %("(?:[^"\\]|\\.)+"|[-\w.$]+)')
+LOOP_ID = re.compile(r'!llvm\.loop !(\d+)')
+METADATA = re.compile(r'^!(\d+) = (?:distinct )?!\{(.*)\}$', re.M)
+METADATA_REF = re.compile(r'!(\d+)')
+METADATA_STRING = re.compile(r'!"([^"]*)"')
+VECTOR = re.compile(r'<(\d+) x ')
+
+# The loop unroller names the exit test of the last copy of the body niter.ncmp.<copies - 1>
+UNROLL_COMPARE = re.compile(r'%niter\.ncmp\.(\d+)')
+
+class Loop:
+    """A loop of an optimized function, found from its back edge"""
+
+    __slots__ = ('function', 'header', 'vector_width', 'unroll', 'hints')
+
+    def __init__(self, function, header, vector_width, unroll, hints):
+        self.function = function
+
+        # Block the back edge jumps to
+        self.header = header
+
+        # Most lanes of the vector instructions of the loop, 1 if it isn't vectorized
+        self.vector_width = vector_width
+
+        # Copies of the body per iteration
+        self.unroll = unroll
+
+        # Strings of the loop's !llvm.loop metadata (llvm.loop.isvectorized...)
+        self.hints = hints
+
+    @property
+    def vectorized(self):
+        return self.vector_width > 1
+
+    def as_dict(self):
+        return {'function':self.function, 'header':self.header, 'vector_width':self.vector_width,
+                'unroll':self.unroll, 'hints':list(self.hints)}
+
+def blocks(function):
+    """(label, instruction lines) of every block of a function's IR"""
+
+    result = []
+    for line in str(function).splitlines():
+        m = BLOCK_LABEL.match(line)
+        if m:
+            result.append((m.group(1).strip('"'), []))
+        elif line.startswith('  '):
+            if not result:
+                # The entry block's label isn't printed when it has no name
+                result.append(('', []))
+            result[-1][1].append(line)
+    return result
+
+def metadata_strings(metadata, id, seen=None):
+    """Strings of a metadata node and of the nodes it refers to"""
+
+    seen = seen if seen is not None else set()
+    seen.add(id)
+    body = metadata.get(id, '')
+    strings = METADATA_STRING.findall(body)
+    for ref in METADATA_REF.findall(METADATA_STRING.sub('', body)):
+        if ref not in seen:
+            strings.extend(metadata_strings(metadata, ref, seen))
+    return strings
+
+def find_loops(module):
+    """Loops of the functions of a parsed (llvmlite.binding) module"""
+
+    metadata = dict(METADATA.findall(str(module)))
+
+    loops = []
+    for func in module.functions:
+        if func.is_declaration:
+            continue
+
+        body = blocks(func)
+        position = {name:i for i, (name, _) in enumerate(body)}
+        for i, (name, lines) in enumerate(body):
+            if not lines:
+                continue
+            terminator = lines[-1]
+            for target in LABEL.findall(terminator):
+                start = position.get(target.strip('"'))
+                # A branch back to a block that isn't after it is a back edge
+                if start is None or start > i:
+                    continue
+
+                code = [line for _, x in body[start:i + 1] for line in x]
+                width = max([int(x) for line in code for x in VECTOR.findall(line)] or [1])
+                unroll = max([int(x) + 1 for line in code for x in UNROLL_COMPARE.findall(line)] or [1])
+                loop_id = LOOP_ID.search(terminator)
+                hints = tuple(metadata_strings(metadata, loop_id.group(1))) if loop_id else ()
+                loops.append(Loop(func.name, body[start][0], width, unroll, hints))
+    return loops
+
+def source_loops(ast):
+    """Function name -> number of while/until loops in the function's source"""
+
+    counts = {}
+    for defn in ast:
+        if defn.kind != 'Def':
+            continue
+        n = 0
+        stack = [defn.body]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, Node):
+                if node.kind in ('While', 'Until'):
+                    n += 1
+                stack.extend(node.children())
+        counts[defn.name] = n
+    return counts
+
+def loop_report(module, ast=None):
+    """
+    Table of the loops of an optimized module, whether each one was
+    vectorized (and how wide) and unrolled. With the program's AST, the
+    functions with fewer loops left than in their source are listed
+    too, their loops were fully unrolled or deleted
+    """
+
+    loops = find_loops(module)
+    lines = ['{:<24} {:<32} {:>10} {:>8}'.format('function', 'loop', 'vectorized', 'unroll')]
+    for loop in loops:
+        if loop.vectorized:
+            vectorized = f'x{loop.vector_width}'
+        elif 'llvm.loop.isvectorized' in loop.hints:
+            # Scalar loop running the iterations left over by the vector loop
+            vectorized = 'remainder'
+        else:
+            vectorized = 'no'
+        lines.append('{:<24} {:<32} {:>10} {:>8}'.format(
+            loop.function, loop.header, vectorized, f'x{loop.unroll}' if loop.unroll > 1 else '-'))
+
+    if ast is not None:
+        left = {}
+        for loop in loops:
+            # The remainders of vectorized and unrolled loops come from the same source loop
+            if loop.header.endswith(('.epil', '.prol')) or (not loop.vectorized and 'llvm.loop.isvectorized' in loop.hints):
+                continue
+            left[loop.function] = left.get(loop.function, 0) + 1
+        for name, n in source_loops(ast).items():
+            removed = n - left.get(name, 0)
+            if removed > 0:
+                lines.append(f'{name}: {removed} loop(s) fully unrolled or removed')
+
+    return '\n'.join(lines)
@@ -0,0 +1,56 @@
+import llvmlite.binding as llvm
+from time import time
+
+
+# Inlining thresholds clang uses for each -O level
+INLINE_THRESHOLD = {0:0, 1:0, 2:225, 3:275}
+
+def pass_manager(opt_level, target_machine=None):
+    """Builds the module pass manager for an -O level (0 to 3)"""
+
+    if opt_level not in INLINE_THRESHOLD:
+        raise ValueError(f'Invalid optimization level {opt_level}, expected 0 to 3')
+
+    pm = llvm.create_module_pass_manager()
+
+    # Lets the vectorizers use the target's cost model
+    if target_machine is not None:
+        target_machine.add_analysis_passes(pm)
+
+    if opt_level == 0:
+        return pm
+
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = opt_level
+    pmb.size_level = 0
+    pmb.loop_vectorize = opt_level >= 2
+    pmb.slp_vectorize = opt_level >= 2
+
+    if INLINE_THRESHOLD[opt_level]:
+        pmb.inlining_threshold = INLINE_THRESHOLD[opt_level]
+    else:
+        pm.add_always_inliner_pass()
+
+    # Every local starts out as an alloca, promote them to registers
+    # before anything else looks at the code
+    pm.add_sroa_pass()
+
+    # Turns recursion into loops, including `return n * f(n - 1)`
+    # (accumulator recursion), which isn't a tail call in the source
+    pm.add_tail_call_elimination_pass()
+    pmb.populate(pm)
+    return pm
+
+def optimize(module, opt_level=2, target_machine=None, pm=None):
+    """
+    Runs the -O<opt_level> pipeline (mem2reg, inlining, GVN, LICM,
+    loop/SLP vectorization...) over a parsed module, in place.
+    A pass manager built by pass_manager() can be given to reuse it.
+    Returns the time it took in seconds
+    """
+
+    if pm is None:
+        pm = pass_manager(opt_level, target_machine)
+    start_time = time()
+    pm.run(module)
+    return time() - start_time
@@ -0,0 +1,187 @@
+from src.pparser.nodes import Node
+
+from ctypes import c_uint64
+from hashlib import sha256
+import json
+import os
+
+
+PROFILE_VERSION = 1
+
+# Largest branch weight, the weights are i32
+MAX_WEIGHT = (1 << 32) - 1
+
+def digest(defn):
+    """Hash of a Def's code, a function's profile is only used for the code it was recorded for"""
+
+    return sha256(repr(defn.as_tuple()).encode('utf8')).hexdigest()[:16]
+
+def count_sites(defn):
+    """Number of counters the instrumented code of a Def needs at most"""
+
+    n = 1
+    stack = [defn.body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Node):
+            if node.kind == 'If':
+                n += 2
+            elif node.kind in ('While', 'Until'):
+                n += 4
+            elif node.kind == 'FuncCall' and node.name != 'printf':
+                n += 1
+            stack.extend(node.children())
+    return n
+
+class FunctionProfile:
+    """
+    How many times a function was entered, each of its conditional
+    branches went each way (in the order the compiler emits them) and
+    each of its call sites was reached
+    """
+
+    __slots__ = ('digest', 'entry', 'branches', 'calls')
+
+    def __init__(self, digest, entry=0, branches=None, calls=None):
+        self.digest = digest
+        self.entry = entry
+
+        # [false, true] count of each branch
+        self.branches = branches or []
+
+        # [callee, count] of each call site
+        self.calls = calls or []
+
+    def merge(self, other):
+        """Adds the counts of another run of the same code"""
+
+        self.entry += other.entry
+        for mine, theirs in zip(self.branches, other.branches):
+            mine[0] += theirs[0]
+            mine[1] += theirs[1]
+        for mine, theirs in zip(self.calls, other.calls):
+            mine[1] += theirs[1]
+
+    def branch_weights(self, site):
+        """(true, false) weights of a branch, scaled down to fit in i32, None if it has no counts"""
+
+        if site >= len(self.branches):
+            return None
+        false, true = self.branches[site]
+        if not false and not true:
+            return None
+        scale = max(1, -(-max(false, true) // MAX_WEIGHT))
+        return true // scale, false // scale
+
+    def as_dict(self):
+        return {'digest':self.digest, 'entry':self.entry, 'branches':self.branches, 'calls':self.calls}
+
+class Profile:
+    """
+    Counts of instrumented runs (see Counters) by function name, saved
+    as JSON. Compiler(profile=...) turns them into branch weights and
+    function entry counts
+    """
+
+    def __init__(self, functions=None):
+        self.functions = functions or {}
+
+    def function(self, name, digest):
+        """Profile of the function, None if there's none for this code of the function"""
+
+        profile = self.functions.get(name)
+        if profile is None or profile.digest != digest:
+            return None
+        return profile
+
+    def merge(self, other):
+        for name, profile in other.functions.items():
+            mine = self.functions.get(name)
+            if mine is None or mine.digest != profile.digest:
+                self.functions[name] = profile
+            else:
+                mine.merge(profile)
+
+    def fingerprint(self):
+        """Hash of the counts, part of the cache key of code compiled with the profile"""
+
+        return sha256(json.dumps(self.as_dict(), sort_keys=True).encode('utf8')).hexdigest()
+
+    def as_dict(self):
+        return {'version':PROFILE_VERSION,
+                'functions':{name:x.as_dict() for name, x in self.functions.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != PROFILE_VERSION:
+            raise ValueError(f"Unsupported profile version {data.get('version')}")
+        return cls({name:FunctionProfile(**x) for name, x in data['functions'].items()})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.as_dict(), file)
+
+    def update_file(self, path):
+        """Merges the counts with the ones already in the file (if any) and saves them there"""
+
+        if os.path.exists(path):
+            profile = Profile.load(path)
+            profile.merge(self)
+        else:
+            profile = self
+        profile.save(path)
+        return profile
+
+    def report(self, n=10):
+        """The `n` most called functions and hottest call sites"""
+
+        functions = sorted(self.functions.items(), key=lambda x: -x[1].entry)[:n]
+        lines = ['{:<32} {:>14}'.format('function', 'calls')]
+        lines += ['{:<32} {:>14}'.format(name, x.entry) for name, x in functions]
+
+        calls = sorted(((caller, callee, count) for caller, x in self.functions.items()
+                        for callee, count in x.calls), key=lambda x: -x[2])[:n]
+        lines += ['', '{:<32} {:>14}'.format('call site', 'count')]
+        lines += ['{:<32} {:>14}'.format(f'{caller} -> {callee}', count) for caller, callee, count in calls]
+        return '\n'.join(lines)
+
+class Counters:
+    """
+    Where the instrumented code of each function counts, filled in by
+    Compiler(counters=...). Every function has a global array of
+    counters: its entry count, then the false and true counts of each
+    branch and the count of each call site, in the order they're emitted
+    """
+
+    def __init__(self):
+        # Function name -> (symbol of its counters, digest, [('branch',) | ('call', callee)])
+        self.functions = {}
+
+    def update(self, other):
+        self.functions.update(other.functions)
+
+    def read(self, address):
+        """Profile of the counts, address(symbol) is the address of a global of the running code"""
+
+        profile = Profile()
+        for name, (symbol, code_digest, sites) in self.functions.items():
+            size = 1 + sum(2 if x[0] == 'branch' else 1 for x in sites)
+            counts = (c_uint64 * size).from_address(address(symbol))
+            function = FunctionProfile(code_digest, counts[0])
+            i = 1
+            for site in sites:
+                if site[0] == 'branch':
+                    function.branches.append([counts[i], counts[i + 1]])
+                    i += 2
+                else:
+                    function.calls.append([site[1], counts[i]])
+                    i += 1
+            profile.functions[name] = function
+        return profile
@@ -0,0 +1,106 @@
+from ctypes import Structure, c_int32, c_int64, c_uint64
+
+
+class Node(Structure):
+    """A node of the calling context tree, laid out as runtime.PROFILE_NODE"""
+
+    _fields_ = [('function', c_int32), ('parent', c_int32), ('child', c_int32), ('sibling', c_int32),
+                ('calls', c_uint64), ('cycles', c_uint64), ('children_cycles', c_uint64)]
+
+class Profiler:
+    """
+    Names of the functions Compiler(profiler=...) profiles, by the id
+    the code passes to gabby.profiler.enter. printf and the threads of
+    the parallel loops (<function>.parallel) are profiled as functions
+    """
+
+    def __init__(self):
+        # Function id -> name, 0 is the root of the tree
+        self.names = ['[root]']
+        self.ids = {}
+
+        # CallTree of the last run read
+        self.tree = None
+
+    def function_id(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def read(self, address):
+        """CallTree of the program run, address(symbol) is the address of a global of the running code"""
+
+        count = c_int32.from_address(address('gabby.profiler.count')).value
+        nodes = (Node * max(count, 1)).from_address(address('gabby.profiler.nodes'))
+        dropped = c_int64.from_address(address('gabby.profiler.dropped')).value
+        self.tree = CallTree([(self.names[x.function], x.parent, x.calls, x.cycles, x.children_cycles)
+                              for x in nodes[:count]], dropped)
+        return self.tree
+
+class CallTree:
+    """
+    Calls and cycles of every function by chain of callers, the
+    functions' totals (see functions) and the tree as folded stacks
+    for flame graphs (see folded)
+    """
+
+    def __init__(self, nodes, dropped=0):
+        # (function name, parent, calls, cycles, cycles spent in the children)
+        self.nodes = nodes
+
+        # Calls not recorded, the tree was full
+        self.dropped = dropped
+
+    @property
+    def total(self):
+        """Cycles spent in the profiled functions"""
+
+        return self.nodes[0][4] if self.nodes else 0
+
+    def path(self, i):
+        """Names of the node's function and its callers, outermost first"""
+
+        names = []
+        while i:
+            names.append(self.nodes[i][0])
+            i = self.nodes[i][1]
+        return names[::-1]
+
+    def functions(self):
+        """
+        Function name -> [calls, inclusive cycles, exclusive cycles]. A
+        recursive function's inclusive cycles are only counted in its
+        outermost calls
+        """
+
+        result = {}
+        for i, (name, parent, calls, cycles, children) in enumerate(self.nodes[1:], 1):
+            stats = result.setdefault(name, [0, 0, 0])
+            stats[0] += calls
+            stats[2] += cycles - children
+            if name not in self.path(parent):
+                stats[1] += cycles
+        return result
+
+    def report(self, n=20):
+        """The `n` functions with the most exclusive cycles"""
+
+        total = self.total or 1
+        functions = sorted(self.functions().items(), key=lambda x: -x[1][2])[:n]
+        lines = ['{:<32} {:>12} {:>16} {:>7} {:>16} {:>7}'.format('function', 'calls', 'inclusive', '%', 'exclusive', '%')]
+        for name, (calls, inclusive, exclusive) in functions:
+            lines.append('{:<32} {:>12} {:>16} {:>6.1f}% {:>16} {:>6.1f}%'.format(
+                name, calls, inclusive, 100 * inclusive / total, exclusive, 100 * exclusive / total))
+        if self.dropped:
+            lines.append(f'{self.dropped} calls not recorded, the call tree is full')
+        return '\n'.join(lines)
+
+    def folded(self):
+        """One `caller;...;function cycles` line per node with exclusive cycles, for flamegraph.pl and speedscope"""
+
+        lines = []
+        for i, (name, parent, calls, cycles, children) in enumerate(self.nodes[1:], 1):
+            if cycles > children:
+                lines.append('{} {}'.format(';'.join(self.path(i)), cycles - children))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,600 @@
+from llvmlite import ir
+
+from contextlib import contextmanager
+from ctypes import CFUNCTYPE, c_int64, c_void_p, cast, string_at
+import sys
+
+
+# Size of the output buffer, it is written out when full and when main returns
+BUFFER_SIZE = 1 << 16
+
+# Longest %f: DBL_MAX has 309 digits, plus the sign, the point and 6 decimals
+FLOAT_SIZE = 320
+
+i8 = ir.IntType(8)
+i32 = ir.IntType(32)
+i64 = ir.IntType(64)
+double = ir.DoubleType()
+void = ir.VoidType()
+
+# void sink(i8* data, i64 size), where the output goes instead of stdout when set
+SINK = ir.FunctionType(void, [i8.as_pointer(), i64])
+
+# Most threads a parallel loop runs on
+MAX_THREADS = 256
+
+# sysconf's name for the number of online processors
+SC_NPROCESSORS_ONLN = 58 if sys.platform == 'darwin' else 84
+
+# void task(i8* context, i32 thread, i32 threads), the outlined body of a parallel loop
+TASK = ir.FunctionType(void, [i8.as_pointer(), i32, i32])
+
+# What each thread of a parallel loop is started with
+WORKER = ir.LiteralStructType([TASK.as_pointer(), i8.as_pointer(), i32, i32])
+
+# Node of the profiler's calling context tree: function, parent, first child,
+# next sibling, calls, cycles, cycles spent in the children (see ProfilerRuntime)
+PROFILE_NODE = ir.LiteralStructType([i32, i32, i32, i32, i64, i64, i64])
+NODE_FUNCTION, NODE_PARENT, NODE_CHILD, NODE_SIBLING, NODE_CALLS, NODE_CYCLES, NODE_CHILDREN_CYCLES = range(7)
+
+# Most nodes the calling context tree can have
+MAX_PROFILE_NODES = 1 << 16
+
+class Runtime:
+    """Helpers to define the linkonce_odr globals and functions of a runtime in a module"""
+
+    def __init__(self, module):
+        self.module = module
+
+    def define_global(self, name, Type):
+        glob = ir.GlobalVariable(self.module, Type, name=name)
+        glob.linkage = 'linkonce_odr'
+        glob.initializer = ir.Constant(Type, None)
+        return glob
+
+    def declare(self, name, fnty):
+        if name in self.module.globals:
+            return self.module.globals[name]
+        return ir.Function(self.module, fnty, name=name)
+
+    def define(self, name, return_type, param_types):
+        func = ir.Function(self.module, ir.FunctionType(return_type, param_types), name=name)
+        func.linkage = 'linkonce_odr'
+        return func, ir.IRBuilder(func.append_basic_block('entry'))
+
+    def keep(self, func):
+        """
+        Adds the function to llvm.used so the optimizer keeps it even
+        if nothing in the module calls it (it's called from Python)
+        """
+
+        Type = ir.ArrayType(i8.as_pointer(), 1)
+        used = ir.GlobalVariable(self.module, Type, name='llvm.used')
+        used.linkage = 'appending'
+        used.section = 'llvm.metadata'
+        used.initializer = ir.Constant(Type, [func.bitcast(i8.as_pointer())])
+
+    def constant_string(self, prefix, data):
+        """Pointer to a private constant global holding `data` (bytes, NUL terminated)"""
+
+        Type = ir.ArrayType(i8, len(data))
+        glob = ir.GlobalVariable(self.module, Type, name=self.module.get_unique_name(prefix))
+        glob.linkage = 'private'
+        glob.unnamed_addr = True
+        glob.global_constant = True
+        glob.initializer = ir.Constant(Type, bytearray(data))
+        return glob.gep([ir.Constant(i32, 0), ir.Constant(i32, 0)])
+
+class OutputRuntime(Runtime):
+    """
+    Buffered output for printf, emitted in a module the first time the
+    module needs it. Everything it defines is linkonce_odr, so modules
+    linked or loaded together share a single buffer. The buffer is
+    written to stdout (write(2)) unless the gabby.output global points
+    to a sink function (see redirect_output)
+    """
+
+    def __init__(self, module):
+        super().__init__(module)
+
+        self.buffer = self.define_global('gabby.buffer', ir.ArrayType(i8, BUFFER_SIZE))
+        self.length = self.define_global('gabby.length', i32)
+        self.sink = self.define_global('gabby.output', SINK.as_pointer())
+
+        self.libc_write = self.declare('write', ir.FunctionType(i64, [i32, i8.as_pointer(), i64]))
+        self.snprintf = self.declare('snprintf', ir.FunctionType(i32, [i8.as_pointer(), i64, i8.as_pointer()], var_arg=True))
+        self.malloc = self.declare('malloc', ir.FunctionType(i8.as_pointer(), [i64]))
+        self.free = self.declare('free', ir.FunctionType(void, [i8.as_pointer()]))
+        self.memcpy = module.declare_intrinsic('llvm.memcpy', [i8.as_pointer(), i8.as_pointer(), i32])
+
+        self.emit = self.define_emit()
+        self.flush = self.define_flush()
+        self.keep(self.flush)
+        self.write = self.define_write()
+        self.write_char = self.define_write_char()
+        self.write_int = self.define_write_int()
+        self.write_float = self.define_write_float()
+
+    def buffer_at(self, builder, index):
+        return builder.gep(self.buffer, [ir.Constant(i32, 0), index], inbounds=True)
+
+    def define_emit(self):
+        """gabby.emit(data, size), writes straight to the sink or to stdout"""
+
+        func, builder = self.define('gabby.emit', void, [i8.as_pointer(), i64])
+        data, size = func.args
+
+        sink = builder.load(self.sink)
+        with builder.if_else(builder.icmp_unsigned('==', sink, ir.Constant(sink.type, None))) as (stdout, custom):
+            with stdout:
+                # write(2) can write less than it was asked to
+                loop = builder.append_basic_block('write')
+                done = builder.append_basic_block('written')
+                start = builder.block
+                builder.branch(loop)
+
+                builder.position_at_end(loop)
+                offset = builder.phi(i64)
+                offset.add_incoming(ir.Constant(i64, 0), start)
+                written = builder.call(self.libc_write, [ir.Constant(i32, 1), builder.gep(data, [offset]),
+                                                         builder.sub(size, offset)])
+                offset_next = builder.add(offset, written)
+                offset.add_incoming(offset_next, loop)
+                more = builder.and_(builder.icmp_signed('>', written, ir.Constant(i64, 0)),
+                                    builder.icmp_signed('<', offset_next, size))
+                builder.cbranch(more, loop, done)
+                builder.position_at_end(done)
+            with custom:
+                builder.call(sink, [data, size])
+        builder.ret_void()
+        return func
+
+    def define_flush(self):
+        """gabby.flush(), writes out and empties the buffer"""
+
+        func, builder = self.define('gabby.flush', void, [])
+        length = builder.load(self.length)
+        with builder.if_then(builder.icmp_unsigned('!=', length, ir.Constant(i32, 0))):
+            builder.call(self.emit, [self.buffer_at(builder, ir.Constant(i32, 0)), builder.zext(length, i64)])
+            builder.store(ir.Constant(i32, 0), self.length)
+        builder.ret_void()
+        return func
+
+    def define_write(self):
+        """gabby.write(data, size), copies the data to the buffer"""
+
+        func, builder = self.define('gabby.write', void, [i8.as_pointer(), i32])
+        data, size = func.args
+
+        length = builder.load(self.length)
+        with builder.if_then(builder.icmp_unsigned('>', builder.add(length, size), ir.Constant(i32, BUFFER_SIZE))):
+            builder.call(self.flush, [])
+            with builder.if_then(builder.icmp_unsigned('>', size, ir.Constant(i32, BUFFER_SIZE))):
+                # Doesn't fit in the buffer at all
+                builder.call(self.emit, [data, builder.zext(size, i64)])
+                builder.ret_void()
+
+        length = builder.load(self.length)
+        builder.call(self.memcpy, [self.buffer_at(builder, length), data, size, ir.Constant(ir.IntType(1), 0)])
+        builder.store(builder.add(length, size), self.length)
+        builder.ret_void()
+        return func
+
+    def define_write_char(self):
+        """gabby.write_char(c)"""
+
+        func, builder = self.define('gabby.write_char', void, [i8])
+        length = builder.load(self.length)
+        with builder.if_then(builder.icmp_unsigned('==', length, ir.Constant(i32, BUFFER_SIZE))):
+            builder.call(self.flush, [])
+        length = builder.load(self.length)
+        builder.store(func.args[0], self.buffer_at(builder, length))
+        builder.store(builder.add(length, ir.Constant(i32, 1)), self.length)
+        builder.ret_void()
+        return func
+
+    def define_write_int(self):
+        """gabby.write_int(value), like %i, returns the number of characters written"""
+
+        func, builder = self.define('gabby.write_int', i32, [i32])
+        digits = builder.alloca(ir.ArrayType(i8, 16))
+        end = ir.Constant(i64, 16)
+
+        # In 64 bits so the absolute value of INT_MIN fits
+        value = builder.sext(func.args[0], i64)
+        negative = builder.icmp_signed('<', value, ir.Constant(i64, 0))
+        value = builder.select(negative, builder.neg(value), value)
+
+        # The digits are written from the end of the array
+        start = builder.block
+        loop = builder.append_basic_block('digit')
+        done = builder.append_basic_block('digits')
+        builder.branch(loop)
+
+        builder.position_at_end(loop)
+        position = builder.phi(i64)
+        position.add_incoming(end, start)
+        rest = builder.phi(i64)
+        rest.add_incoming(value, start)
+
+        position_next = builder.sub(position, ir.Constant(i64, 1))
+        digit = builder.trunc(builder.urem(rest, ir.Constant(i64, 10)), i8)
+        builder.store(builder.add(digit, ir.Constant(i8, ord('0'))),
+                      builder.gep(digits, [ir.Constant(i64, 0), position_next]))
+        rest_next = builder.udiv(rest, ir.Constant(i64, 10))
+        position.add_incoming(position_next, loop)
+        rest.add_incoming(rest_next, loop)
+        builder.cbranch(builder.icmp_unsigned('!=', rest_next, ir.Constant(i64, 0)), loop, done)
+
+        builder.position_at_end(done)
+        sign_position = builder.sub(position_next, ir.Constant(i64, 1))
+        builder.store(ir.Constant(i8, ord('-')), builder.gep(digits, [ir.Constant(i64, 0), sign_position]))
+        first = builder.select(negative, sign_position, position_next)
+
+        size = builder.trunc(builder.sub(end, first), i32)
+        builder.call(self.write, [builder.gep(digits, [ir.Constant(i64, 0), first]), size])
+        builder.ret(size)
+        return func
+
+    def define_write_float(self):
+        """gabby.write_float(value), %f formatted by snprintf, returns the number of characters written"""
+
+        func, builder = self.define('gabby.write_float', i32, [double])
+        text = builder.alloca(ir.ArrayType(i8, FLOAT_SIZE))
+        text = builder.gep(text, [ir.Constant(i32, 0), ir.Constant(i32, 0)])
+
+        format = self.constant_string('gabby.float_format', b'%f\0')
+        size = builder.call(self.snprintf, [text, ir.Constant(i64, FLOAT_SIZE), format, func.args[0]])
+        size = builder.select(builder.icmp_signed('<', size, ir.Constant(i32, FLOAT_SIZE)),
+                              size, ir.Constant(i32, FLOAT_SIZE - 1))
+        builder.call(self.write, [text, size])
+        builder.ret(size)
+        return func
+
+    def printf(self, builder, args):
+        """
+        Emits a printf of args (the format and its arguments, already
+        promoted like C variadic arguments) formatted by snprintf right
+        into the buffer. The buffer is written out first if the text
+        doesn't fit, text longer than the buffer is written out by itself.
+        Returns the number of characters, like printf
+        """
+
+        zero = ir.Constant(i32, 0)
+        size = ir.Constant(i32, BUFFER_SIZE)
+        length = builder.load(self.length)
+        room = builder.sub(size, length)
+        n = builder.call(self.snprintf, [self.buffer_at(builder, length), builder.zext(room, i64), *args])
+        with builder.if_else(builder.icmp_signed('<', n, room)) as (fits, truncated):
+            with fits:
+                # n < 0 is an error, nothing was written
+                with builder.if_then(builder.icmp_signed('>', n, zero)):
+                    builder.store(builder.add(length, n), self.length)
+            with truncated:
+                builder.call(self.flush, [])
+                with builder.if_else(builder.icmp_signed('<', n, size)) as (refits, larger):
+                    with refits:
+                        builder.call(self.snprintf, [self.buffer_at(builder, zero), ir.Constant(i64, BUFFER_SIZE), *args])
+                        builder.store(n, self.length)
+                    with larger:
+                        self.emit_formatted(builder, args, n)
+        return n
+
+    def unbuffered_printf(self, builder, args):
+        """
+        Emits a printf of args that bypasses the buffer, for the threads
+        of parallel loops which can't share it: the text is formatted in
+        memory of its own and written out (to the sink or stdout) at once.
+        Returns the number of characters
+        """
+
+        n = builder.call(self.snprintf, [ir.Constant(i8.as_pointer(), None), ir.Constant(i64, 0), *args])
+        with builder.if_then(builder.icmp_signed('>', n, ir.Constant(i32, 0))):
+            self.emit_formatted(builder, args, n)
+        return n
+
+    def emit_formatted(self, builder, args, n):
+        """Formats args, `n` characters long, in a malloc'd block and writes it out"""
+
+        size = builder.zext(builder.add(n, ir.Constant(i32, 1)), i64)
+        text = builder.call(self.malloc, [size])
+        with builder.if_then(builder.icmp_unsigned('!=', text, ir.Constant(text.type, None))):
+            builder.call(self.snprintf, [text, size, *args])
+            builder.call(self.emit, [text, builder.zext(n, i64)])
+            builder.call(self.free, [text])
+
+class ParallelRuntime(Runtime):
+    """
+    Runs the outlined bodies of parallel loops on native threads
+    (pthreads), the thread that reaches the loop takes part as thread 0.
+    The threads are started for each loop and joined at its end, so no
+    thread outlives the engine holding the code it runs. The number of
+    threads is the GABBY_THREADS environment variable or the number of
+    online processors. A loop reached while another one is running
+    (nested loops, or from another thread) runs on its caller's thread
+    """
+
+    def __init__(self, module):
+        super().__init__(module)
+
+        self.thread_count = self.define_global('gabby.thread_count', i32)
+        self.active = self.define_global('gabby.parallel_active', i32)
+
+        self.getenv = self.declare('getenv', ir.FunctionType(i8.as_pointer(), [i8.as_pointer()]))
+        self.atoi = self.declare('atoi', ir.FunctionType(i32, [i8.as_pointer()]))
+        self.sysconf = self.declare('sysconf', ir.FunctionType(i64, [i32]))
+        self.pthread_create = self.declare('pthread_create', ir.FunctionType(
+            i32, [i64.as_pointer(), i8.as_pointer(), ir.FunctionType(i8.as_pointer(), [i8.as_pointer()]).as_pointer(), i8.as_pointer()]))
+        self.pthread_join = self.declare('pthread_join', ir.FunctionType(i32, [i64, i8.as_pointer().as_pointer()]))
+
+        self.threads = self.define_threads()
+        self.worker = self.define_worker()
+        self.run = self.define_run()
+
+    def define_threads(self):
+        """gabby.threads(), number of threads parallel loops run on"""
+
+        func, builder = self.define('gabby.threads', i32, [])
+        count = builder.alloca(i32)
+        with builder.if_then(builder.icmp_unsigned('==', builder.load(self.thread_count), ir.Constant(i32, 0))):
+            env = builder.call(self.getenv, [self.constant_string('gabby.threads_env', b'GABBY_THREADS\0')])
+            builder.store(ir.Constant(i32, 0), count)
+            with builder.if_then(builder.icmp_unsigned('!=', env, ir.Constant(env.type, None))):
+                builder.store(builder.call(self.atoi, [env]), count)
+            with builder.if_then(builder.icmp_signed('<=', builder.load(count), ir.Constant(i32, 0))):
+                online = builder.call(self.sysconf, [ir.Constant(i32, SC_NPROCESSORS_ONLN)])
+                builder.store(builder.trunc(online, i32), count)
+
+            n = builder.load(count)
+            n = builder.select(builder.icmp_signed('<', n, ir.Constant(i32, 1)), ir.Constant(i32, 1), n)
+            n = builder.select(builder.icmp_signed('>', n, ir.Constant(i32, MAX_THREADS)), ir.Constant(i32, MAX_THREADS), n)
+            # Every thread computes the same count, no need to synchronize
+            builder.store(n, self.thread_count)
+        builder.ret(builder.load(self.thread_count))
+        return func
+
+    def define_worker(self):
+        """gabby.parallel_worker(worker), start routine of the threads"""
+
+        func, builder = self.define('gabby.parallel_worker', i8.as_pointer(), [i8.as_pointer()])
+        worker = builder.bitcast(func.args[0], WORKER.as_pointer())
+        task, context, thread, threads = [builder.load(builder.gep(worker, [ir.Constant(i32, 0), ir.Constant(i32, i)]))
+                                          for i in range(4)]
+        builder.call(task, [context, thread, threads])
+        builder.ret(ir.Constant(i8.as_pointer(), None))
+        return func
+
+    def define_run(self):
+        """
+        gabby.parallel(task, context, units), runs task on as many threads
+        as there are units of work (up to gabby.threads()), returns the
+        number of threads it ran on
+        """
+
+        func, builder = self.define('gabby.parallel', i32, [TASK.as_pointer(), i8.as_pointer(), i32])
+        task, context, units = func.args
+        zero = ir.Constant(i32, 0)
+        one = ir.Constant(i32, 1)
+
+        workers = builder.alloca(ir.ArrayType(WORKER, MAX_THREADS))
+        ids = builder.alloca(ir.ArrayType(i64, MAX_THREADS))
+        started = builder.alloca(ir.ArrayType(ir.IntType(1), MAX_THREADS))
+
+        with builder.if_then(builder.icmp_signed('<=', units, zero)):
+            builder.ret(zero)
+
+        threads = builder.call(self.threads, [])
+        threads = builder.select(builder.icmp_signed('<', units, threads), units, threads)
+        running = builder.atomic_rmw('add', self.active, one, 'seq_cst')
+        with builder.if_then(builder.or_(builder.icmp_unsigned('!=', running, zero),
+                                         builder.icmp_signed('<=', threads, one))):
+            builder.call(task, [context, zero, one])
+            builder.atomic_rmw('sub', self.active, one, 'seq_cst')
+            builder.ret(one)
+
+        def each_thread(body):
+            """Runs body(builder, thread) for the threads 1 to threads - 1"""
+
+            start = builder.block
+            loop = builder.append_basic_block('thread')
+            done = builder.append_basic_block('threads')
+            builder.branch(loop)
+            builder.position_at_end(loop)
+            thread = builder.phi(i32)
+            thread.add_incoming(one, start)
+            body(thread)
+            thread_next = builder.add(thread, one)
+            thread.add_incoming(thread_next, builder.block)
+            builder.cbranch(builder.icmp_signed('<', thread_next, threads), loop, done)
+            builder.position_at_end(done)
+
+        def start(thread):
+            worker = builder.gep(workers, [zero, thread])
+            for i, value in enumerate([task, context, thread, threads]):
+                builder.store(value, builder.gep(worker, [zero, ir.Constant(i32, i)]))
+            error = builder.call(self.pthread_create, [builder.gep(ids, [zero, thread]), ir.Constant(i8.as_pointer(), None),
+                                                       self.worker, builder.bitcast(worker, i8.as_pointer())])
+            builder.store(builder.icmp_unsigned('==', error, zero), builder.gep(started, [zero, thread]))
+
+        def join(thread):
+            with builder.if_else(builder.load(builder.gep(started, [zero, thread]))) as (joined, failed):
+                with joined:
+                    builder.call(self.pthread_join, [builder.load(builder.gep(ids, [zero, thread])),
+                                                     ir.Constant(i8.as_pointer().as_pointer(), None)])
+                with failed:
+                    # The thread couldn't be started, its share runs here
+                    builder.call(task, [context, thread, threads])
+
+        each_thread(start)
+        builder.call(task, [context, zero, threads])
+        each_thread(join)
+
+        builder.atomic_rmw('sub', self.active, one, 'seq_cst')
+        builder.ret(threads)
+        return func
+
+class ProfilerRuntime(Runtime):
+    """
+    Calling context tree of the profiled functions (see Compiler(profiler=...)):
+    every node is a function called from a chain of callers, with its
+    number of calls, the cycles (llvm.readcyclecounter) spent in it and
+    in what it called, and the cycles spent in what it called. Node 0 is
+    the root, the nodes are linked to their parent, first child and next
+    sibling, 0 meaning none. Calls made once the tree is full, or while
+    the profiler is paused (the threads of a parallel loop run), aren't
+    recorded
+    """
+
+    def __init__(self, module):
+        super().__init__(module)
+
+        self.nodes = self.define_global('gabby.profiler.nodes', ir.ArrayType(PROFILE_NODE, MAX_PROFILE_NODES))
+        self.count = self.define_global('gabby.profiler.count', i32)
+        self.current = self.define_global('gabby.profiler.current', i32)
+        self.paused = self.define_global('gabby.profiler.paused', i32)
+        self.dropped = self.define_global('gabby.profiler.dropped', i64)
+
+        self.clock = module.declare_intrinsic('llvm.readcyclecounter', fnty=ir.FunctionType(i64, []))
+
+        self.enter = self.define_enter()
+        self.exit = self.define_exit()
+
+    def field(self, builder, node, i):
+        return builder.gep(self.nodes, [ir.Constant(i32, 0), node, ir.Constant(i32, i)], inbounds=True)
+
+    def increment(self, builder, ptr, value):
+        builder.store(builder.add(builder.load(ptr), value), ptr)
+
+    def define_enter(self):
+        """
+        gabby.profiler.enter(function), moves to the node of the function
+        called from the current one and counts the call. Returns the node,
+        -1 if the call isn't recorded
+        """
+
+        func, builder = self.define('gabby.profiler.enter', i32, [i32])
+        function = func.args[0]
+        zero = ir.Constant(i32, 0)
+        one = ir.Constant(i32, 1)
+
+        with builder.if_then(builder.icmp_unsigned('!=', builder.load(self.paused), zero)):
+            builder.ret(ir.Constant(i32, -1))
+        with builder.if_then(builder.icmp_unsigned('==', builder.load(self.count), zero)):
+            # The root
+            builder.store(one, self.count)
+
+        current = builder.load(self.current)
+        child = builder.load(self.field(builder, current, NODE_CHILD))
+        start = builder.block
+        search = builder.append_basic_block('search')
+        compare = builder.append_basic_block('compare')
+        missing = builder.append_basic_block('missing')
+        found = builder.append_basic_block('found')
+        builder.branch(search)
+
+        # Looks for the function among the current node's children
+        builder.position_at_end(search)
+        node = builder.phi(i32)
+        node.add_incoming(child, start)
+        builder.cbranch(builder.icmp_unsigned('==', node, zero), missing, compare)
+
+        builder.position_at_end(compare)
+        sibling = builder.load(self.field(builder, node, NODE_SIBLING))
+        node.add_incoming(sibling, compare)
+        builder.cbranch(builder.icmp_unsigned('==', builder.load(self.field(builder, node, NODE_FUNCTION)), function),
+                        found, search)
+
+        builder.position_at_end(missing)
+        count = builder.load(self.count)
+        with builder.if_then(builder.icmp_unsigned('>=', count, ir.Constant(i32, MAX_PROFILE_NODES))):
+            self.increment(builder, self.dropped, ir.Constant(i64, 1))
+            builder.ret(ir.Constant(i32, -1))
+        builder.store(builder.add(count, one), self.count)
+        builder.store(function, self.field(builder, count, NODE_FUNCTION))
+        builder.store(current, self.field(builder, count, NODE_PARENT))
+        first_child = self.field(builder, current, NODE_CHILD)
+        builder.store(builder.load(first_child), self.field(builder, count, NODE_SIBLING))
+        builder.store(count, first_child)
+        added = builder.block
+        builder.branch(found)
+
+        builder.position_at_end(found)
+        result = builder.phi(i32)
+        result.add_incoming(node, compare)
+        result.add_incoming(count, added)
+        self.increment(builder, self.field(builder, result, NODE_CALLS), ir.Constant(i64, 1))
+        builder.store(result, self.current)
+        builder.ret(result)
+        return func
+
+    def define_exit(self):
+        """gabby.profiler.exit(node, start), adds the cycles since start to the node and moves back to its parent"""
+
+        func, builder = self.define('gabby.profiler.exit', void, [i32, i64])
+        node, start = func.args
+
+        with builder.if_then(builder.icmp_signed('<', node, ir.Constant(i32, 0))):
+            builder.ret_void()
+        cycles = builder.sub(builder.call(self.clock, []), start)
+        self.increment(builder, self.field(builder, node, NODE_CYCLES), cycles)
+        parent = builder.load(self.field(builder, node, NODE_PARENT))
+        self.increment(builder, self.field(builder, parent, NODE_CHILDREN_CYCLES), cycles)
+        builder.store(parent, self.current)
+        builder.ret_void()
+        return func
+
+def parse_format(data):
+    """
+    Splits a printf format (bytes) into literal bytes and 'i'/'f' for
+    %i (or %d) and %f. Returns None if it has any other conversion
+    """
+
+    parts = []
+    literal = bytearray()
+    i = 0
+    while i < len(data):
+        c = data[i:i + 1]
+        if c != b'%':
+            literal += c
+            i += 1
+            continue
+
+        spec = data[i + 1:i + 2]
+        if spec == b'%':
+            literal += b'%'
+        elif spec in (b'i', b'd', b'f'):
+            if literal:
+                parts.append(bytes(literal))
+                literal = bytearray()
+            parts.append('f' if spec == b'f' else 'i')
+        else:
+            return None
+        i += 2
+
+    if literal:
+        parts.append(bytes(literal))
+    return parts
+
+# Python side of gabby.output
+SinkFunction = CFUNCTYPE(None, c_void_p, c_int64)
+
+@contextmanager
+def redirect_output(address, output):
+    """
+    While in the block, the output of the program whose gabby.output
+    global is at `address` goes to output.write (which takes bytes),
+    instead of stdout. Does nothing if output or address is None/0
+    """
+
+    if not address or output is None:
+        yield
+        return
+
+    sink = SinkFunction(lambda data, size: output.write(string_at(data, size)))
+    slot = c_void_p.from_address(address)
+    previous = slot.value
+    slot.value = cast(sink, c_void_p).value
+    try:
+        yield
+    finally:
+        slot.value = previous
@@ -0,0 +1,56 @@
+class Scope:
+    """
+    Names visible in the module or in a function, mapped to (pointer,
+    type). A function's scope only holds what the function defines,
+    names it doesn't define are looked up in its parent (the module's
+    scope), so entering and leaving a function doesn't copy anything
+    """
+
+    __slots__ = ('names', 'parent', 'kind')
+
+    def __init__(self, parent=None, kind='module'):
+        self.names = {}
+        self.parent = parent
+
+        # 'module' or 'function'
+        self.kind = kind
+
+    def child(self, kind='function'):
+        return Scope(self, kind)
+
+    def lookup(self, name):
+        """(pointer, type) of the name, from the innermost scope defining it, None if no scope does"""
+
+        scope = self
+        while scope is not None:
+            value = scope.names.get(name)
+            if value is not None:
+                return value
+            scope = scope.parent
+        return None
+
+    def __getitem__(self, name):
+        value = self.lookup(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def __setitem__(self, name, value):
+        """Defines the name in this scope, hiding the outer scopes' definition"""
+
+        self.names[name] = value
+
+    def get(self, name, default=None):
+        value = self.lookup(name)
+        return default if value is None else value
+
+    def module(self):
+        """The outermost scope"""
+
+        scope = self
+        while scope.parent is not None:
+            scope = scope.parent
+        return scope
@@ -0,0 +1,87 @@
+from llvmlite import ir
+
+
+# Vector type -> (element type, lanes)
+VECTOR_TYPES = {
+    'int4':('int', 4),
+    'int8':('int', 8),
+    'float4':('float', 4),
+    'float8':('float', 8),
+}
+
+# Masks, what comparing vectors gives, one i1 per lane
+MASK_TYPES = {
+    'bool4':4,
+    'bool8':8,
+}
+
+# Alignment of the elements of int[] and float[] arrays
+ELEMENT_ALIGN = 4
+
+# Functions of the language working on vectors, a function the program
+# defines with the same name is called instead
+VECTOR_BUILTINS = {'select', 'sum', 'product', 'min', 'max', 'any', 'all', 'store'}
+
+def is_mask(Type):
+    return isinstance(Type, ir.VectorType) and Type.element == ir.IntType(1)
+
+def splat(builder, value, Type):
+    """Vector of Type with `value` in every lane"""
+
+    lanes = Type.count
+    vector = builder.insert_element(ir.Constant(Type, ir.Undefined), value, ir.Constant(ir.IntType(32), 0))
+    mask = ir.Constant(ir.VectorType(ir.IntType(32), lanes), [0] * lanes)
+    return builder.shuffle_vector(vector, ir.Constant(Type, ir.Undefined), mask)
+
+def build(builder, values, Type):
+    """Vector of Type with the values in its lanes"""
+
+    vector = ir.Constant(Type, ir.Undefined)
+    for i, value in enumerate(values):
+        vector = builder.insert_element(vector, value, ir.Constant(ir.IntType(32), i))
+    return vector
+
+def load(builder, ptr, Type):
+    """Vector of Type from the array elements `ptr` points to, which are only aligned like an element"""
+
+    return builder.load(builder.bitcast(ptr, Type.as_pointer()), align=ELEMENT_ALIGN)
+
+def store(builder, vector, ptr):
+    """Writes the lanes of the vector to the array elements `ptr` points to"""
+
+    builder.store(vector, builder.bitcast(ptr, vector.type.as_pointer()), align=ELEMENT_ALIGN)
+
+def minimum(builder, a, b):
+    """Lane wise minimum of a and b (vectors or scalars)"""
+
+    if isinstance(a.type.element if isinstance(a.type, ir.VectorType) else a.type, ir.IntType):
+        less = builder.icmp_signed('<', a, b)
+    else:
+        less = builder.fcmp_ordered('<', a, b)
+    return builder.select(less, a, b)
+
+def maximum(builder, a, b):
+    """Lane wise maximum of a and b (vectors or scalars)"""
+
+    if isinstance(a.type.element if isinstance(a.type, ir.VectorType) else a.type, ir.IntType):
+        greater = builder.icmp_signed('>', a, b)
+    else:
+        greater = builder.fcmp_ordered('>', a, b)
+    return builder.select(greater, a, b)
+
+def reduce(builder, vector, combine):
+    """
+    Combines the lanes of the vector with combine(builder, a, b), halving
+    the vector until one lane is left (the shuffles LLVM turns into
+    horizontal operations), returns the scalar
+    """
+
+    lanes = vector.type.count
+    undefined = ir.Constant(vector.type, ir.Undefined)
+    while lanes > 1:
+        lanes //= 2
+        # Moves the upper half of the lanes still in use to the lower half
+        mask = list(range(lanes, 2 * lanes)) + [lanes] * (vector.type.count - lanes)
+        upper = builder.shuffle_vector(vector, undefined, ir.Constant(ir.VectorType(ir.IntType(32), vector.type.count), mask))
+        vector = combine(builder, vector, upper)
+    return builder.extract_element(vector, ir.Constant(ir.IntType(32), 0))
@@ -0,0 +1,173 @@
+from src import initialize_llvm, parse
+from src.compiler.callgraph import callees, signature
+from src.compiler.compiler import Compiler
+from src.compiler.effects import function_attributes
+from src.compiler.vectors import VECTOR_BUILTINS, VECTOR_TYPES
+from src.pparser.nodes import Node
+from src.compiler.optimizer import pass_manager
+from src.stats import phase, count_nodes
+
+import llvmlite.binding as llvm
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import atexit
+import os
+
+
+# (cpu, features) -> target machine and (opt_level, cpu, features) -> pass manager,
+# built once per worker process
+_target_machines = {}
+_pass_managers = {}
+
+# Worker processes shared by every compile_parallel call, so the caches above
+# outlive a compile, and the number of workers it has (see worker_pool)
+_pool = None
+_pool_workers = 0
+_pool_lock = Lock()
+
+def worker_pool(workers):
+    """
+    The pool of worker processes, created the first time it's needed and
+    replaced by a bigger one when more workers are asked for. It's shut
+    down when Python exits
+    """
+
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(workers, initializer=initialize_llvm)
+            _pool_workers = workers
+        return _pool
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def compile_shard(name, defs, declarations, opt_level, triple, cpu='', features='', profile=None, attributes=None):
+    """
+    Compiles and optimizes some of the functions of a program (in a
+    worker process), the functions they call from other shards are
+    declared from their signatures, with the `attributes` found for the
+    whole program. Returns the module as bitcode
+    """
+
+    initialize_llvm()
+
+    compiler = Compiler(name, profile=profile, attributes=attributes)
+    for callee, types in declarations.items():
+        compiler.declare(callee, *types)
+    compiler.compile(defs)
+
+    if (cpu, features) not in _target_machines:
+        target = llvm.Target.from_triple(triple)
+        _target_machines[cpu, features] = target.create_target_machine(cpu=cpu, features=features)
+    target_machine = _target_machines[cpu, features]
+    compiler.module.triple = triple
+    compiler.module.data_layout = str(target_machine.target_data)
+
+    module = llvm.parse_assembly(str(compiler.module))
+    module.verify()
+    if opt_level:
+        if (opt_level, cpu, features) not in _pass_managers:
+            _pass_managers[opt_level, cpu, features] = pass_manager(opt_level, target_machine)
+        _pass_managers[opt_level, cpu, features].run(module)
+    return module.as_bitcode()
+
+def split(defs, shards):
+    """Splits the Defs in up to `shards` consecutive runs of about as many AST nodes"""
+
+    sizes = [count_nodes(x) for x in defs]
+    target = sum(sizes) / shards
+
+    result = [[]]
+    size = 0
+    for defn, n in zip(defs, sizes):
+        if size >= target and len(result) < shards:
+            result.append([])
+            size = 0
+        result[-1].append(defn)
+        size += n
+    return result
+
+def calls(node):
+    """Names of the functions called in the node, in the order the compiler looks them up (arguments first)"""
+
+    if isinstance(node, list):
+        for x in node:
+            yield from calls(x)
+    elif isinstance(node, Node):
+        for x in node.children():
+            yield from calls(x)
+        if node.kind == 'FuncCall':
+            yield node.name
+
+def check_functions(defs):
+    """
+    Raises the error compiling the Defs in a single module would raise
+    first for a function defined twice or a call to a function that
+    isn't defined, the workers only see part of the program
+    """
+
+    defined = {x.name for x in defs}
+    known = defined | {'printf'} | set(VECTOR_TYPES) | VECTOR_BUILTINS
+    compiled = set()
+    for defn in defs:
+        if defn.name in compiled:
+            raise SyntaxError(f"Function '{defn.name}' is defined more than once")
+        compiled.add(defn.name)
+        for name in calls(defn.body):
+            if name not in known:
+                raise KeyError(name)
+
+def compile_parallel(code, opt_level=0, jobs=None, triple=None, stats=None, cpu='', features='', profile=None, ast=None):
+    """
+    Compiles the code with its functions split across `jobs` worker
+    processes (os.cpu_count() by default), each one generating and
+    optimizing the code of its share of the functions. The modules
+    they return are linked into a single parsed module, in the order
+    the functions are defined. No optimization pass runs after linking,
+    so calls between functions compiled by different workers are never
+    inlined. The workers are kept for the next calls (see worker_pool).
+    cpu and features are the ones target_cpu returns, `profile` is the
+    Profile of the branch weights, `ast` the code's AST if it's already parsed
+    """
+
+    jobs = jobs or os.cpu_count()
+    triple = triple or llvm.get_default_triple()
+
+    if ast is None:
+        ast = parse(code, stats)
+    defs = [x for x in ast if x.kind == 'Def']
+    # Functions can be called before they're defined (see Compiler.compile),
+    # every shard declares the ones it calls from other shards
+    check_functions(defs)
+    signatures = {x.name:signature(x) for x in defs}
+    attributes = function_attributes(defs)
+
+    shards = []
+    for i, shard in enumerate(split(defs, jobs)):
+        defined = {x.name for x in shard}
+        called = set().union(*[callees(x) for x in shard])
+        declarations = {x:signatures[x] for x in called - defined if x in signatures}
+        shard_attributes = {x:attributes[x] for x in defined | set(declarations)}
+        shards.append((f'main.{i}', shard, declarations, opt_level, triple, cpu, features, profile, shard_attributes))
+
+    with phase(stats, 'codegen'):
+        bitcode = list(worker_pool(jobs).map(compile_shard, *zip(*shards)))
+
+    with phase(stats, 'link'):
+        module = llvm.parse_bitcode(bitcode[0])
+        for x in bitcode[1:]:
+            module.link_in(llvm.parse_bitcode(x))
+
+    if stats is not None:
+        stats.count('ast_nodes', count_nodes(ast))
+        stats.count('functions', len(defs))
+        stats.count('shards', len(shards))
+    return module
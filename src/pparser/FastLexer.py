@@ -0,0 +1,180 @@
+from src.pparser.Lexer import PLexer, LexError, group, Hexnumber, Binnumber, Octnumber, Decnumber, Pointfloat, Expfloat
+
+import mmap
+import re
+
+
+class Token:
+    """Same fields as sly's tokens, so PParser can consume them"""
+
+    __slots__ = ('type', 'value', 'lineno', 'index', 'end')
+
+    def __init__(self, type, value, lineno, index, end):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.index = index
+        self.end = end
+
+    def __repr__(self):
+        return f'Token(type={self.type!r}, value={self.value!r}, lineno={self.lineno}, index={self.index}, end={self.end})'
+
+# Operators, matched as one group and looked up here
+OPERATORS = {
+    '<<':'LSHIFT',
+    '>>':'RSHIFT',
+    '>=':'GE',
+    '<=':'LE',
+    '!=':'NE',
+    '==':'EQEQ',
+    '|':'OR',
+    '&':'AND',
+    '^':'XOR',
+    '>':'GT',
+    '<':'LT',
+    '=':'EQ',
+    '{':'LBRACE',
+    '}':'RBRACE',
+    '[':'LBRACKET',
+    ']':'RBRACKET',
+    '(':'LPAREN',
+    ')':'RPAREN',
+    '+':'PLUS',
+    '-':'MINUS',
+    '*':'TIMES',
+    '/':'DIVIDE',
+    '%':'MOD',
+    ':':'COLON',
+    ',':'COMMA',
+    ';':';', # literal, its type is the character itself
+}
+
+# Same tokens as PLexer, ordered by how often they show up (none of
+# them start with the same character except FLOAT/NUMBER and the
+# operators, which keep PLexer's order). Blanks are skipped as part
+# of the next token so they don't cost a match of their own
+MASTER = re.compile(r'[ \t\r]*(?:' + '|'.join(f'(?P<{name}>{pattern})' for name, pattern in [
+    ('NAME', r'[a-zA-Z_][a-zA-Z0-9_]*'),
+    ('OPERATOR', r'<<|>>|>=|<=|!=|==|[|&^><={}()\[\]+\-*/%:,;]'),
+    ('newline', r'\n'),
+    ('FLOAT', group(Pointfloat, Expfloat)),
+    ('NUMBER', group(Hexnumber, Binnumber, Octnumber, Decnumber)),
+    ('STRING', r'"[^"\n]*"|\'[^\'\n]*\''),
+    ('COMMENT', r'\#.*'),
+    ('error', r'.'),
+]) + ')')
+
+_GROUP_NAMES = {i:name for name, i in MASTER.groupindex.items()}
+_NAME = MASTER.groupindex['NAME']
+_OPERATOR = MASTER.groupindex['OPERATOR']
+_NEWLINE = MASTER.groupindex['newline']
+_COMMENT = MASTER.groupindex['COMMENT']
+
+KEYWORDS = {
+    'if':'IF',
+    'else':'ELSE',
+    'def':'DEF',
+    'return':'RETURN',
+    'while':'WHILE',
+    'until':'UNTIL',
+    'parallel':'PARALLEL',
+    'break':'BREAK',
+    'continue':'CONTINUE',
+}
+
+# Size of the chunks (whole lines) files are read in
+CHUNK_SIZE = 1 << 20
+
+class FastLexer:
+    """
+    Drop-in replacement of PLexer: one precompiled master pattern
+    matched line by line (no token spans a newline), so sources can be
+    streamed from files or mmaps. Produces the same tokens, lineno and
+    index as PLexer and raises LexError on illegal characters
+    """
+
+    tokens = PLexer.tokens
+
+    def __init__(self):
+        self.lineno = 1
+        self.index = 0
+
+    def tokenize(self, text):
+        """Tokens of a string"""
+
+        return self.tokenize_chunks([text])
+
+    def tokenize_file(self, file):
+        """Tokens of a file opened in text mode, read a chunk of lines at a time"""
+
+        def chunks():
+            while True:
+                lines = file.readlines(CHUNK_SIZE)
+                if not lines:
+                    return
+                yield ''.join(lines)
+
+        return self.tokenize_chunks(chunks())
+
+    def tokenize_path(self, path, encoding='utf8'):
+        """Tokens of the file at `path`, which is mmapped instead of read"""
+
+        with open(path, 'rb') as file:
+            try:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                return
+            with mm:
+                yield from self.tokenize_chunks(self._mmap_chunks(mm, encoding))
+
+    @staticmethod
+    def _mmap_chunks(mm, encoding):
+        start = 0
+        size = len(mm)
+        while start < size:
+            # Cut after a newline, tokens never span lines
+            end = mm.find(b'\n', min(start + CHUNK_SIZE, size) - 1)
+            end = size if end == -1 else end + 1
+            yield mm[start:end].decode(encoding)
+            start = end
+
+    def tokenize_chunks(self, chunks):
+        """Tokens of an iterable of strings, each chunk must end on a line boundary"""
+
+        lineno = self.lineno
+        index = self.index
+        keywords = KEYWORDS
+        operators = OPERATORS
+
+        # Groups are compared by number, cheaper than m.lastgroup
+        for chunk in chunks:
+            for m in MASTER.finditer(chunk):
+                i = m.lastindex
+                if i == _NAME:
+                    value = m.group(i)
+                    kind = keywords.get(value, 'NAME')
+                elif i == _OPERATOR:
+                    value = m.group(i)
+                    kind = operators[value]
+                elif i == _NEWLINE:
+                    lineno += 1
+                    continue
+                elif i == _COMMENT or i is None:
+                    # i is None for blanks at the end of the source
+                    continue
+                else:
+                    value = m.group(i)
+                    kind = _GROUP_NAMES[i]
+                    if kind == 'error':
+                        self.lineno = lineno
+                        self.index = index + m.end() - 1
+                        raise LexError(value, lineno, self.index)
+
+                end = index + m.end()
+                yield Token(kind, value, lineno, end - len(value), end)
+
+            index += len(chunk)
+
+        self.lineno = lineno
+        self.index = index
@@ -0,0 +1,332 @@
+import src.pparser.utils as utils
+
+
+class ParseError(Exception):
+    """Every syntax error found in the source, see `errors`"""
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(x[0] for x in errors))
+
+        # (message, lineno, index) of each error
+        self.errors = errors
+
+class _Error(Exception):
+    """Unwinds to the enclosing statement list, which recovers from the error"""
+
+# Binding power of the binary operators and their associativity. These
+# match how PParser's precedence table resolves conflicts: AND and MOD
+# are not in the table so they bind the loosest and group to the right,
+# comparisons and OR can't be chained (nonassoc)
+BINARY = {
+    'AND':(1, 'right'),
+    'MOD':(1, 'right'),
+    'NE':(2, 'nonassoc'),
+    'LT':(2, 'nonassoc'),
+    'LE':(2, 'nonassoc'),
+    'GT':(2, 'nonassoc'),
+    'GE':(2, 'nonassoc'),
+    'EQEQ':(2, 'nonassoc'),
+    'OR':(2, 'nonassoc'),
+    'PLUS':(3, 'left'),
+    'MINUS':(3, 'left'),
+    'TIMES':(4, 'left'),
+    'DIVIDE':(4, 'left'),
+    'LSHIFT':(5, 'left'),
+    'RSHIFT':(5, 'left'),
+}
+
+# Statements start with one of these, used to resynchronize after an error
+STATEMENT_START = {'DEF', 'IF', 'WHILE', 'UNTIL', 'PARALLEL', 'RETURN', 'RBRACE'}
+
+class FastParser:
+    """
+    Recursive descent parser, expressions are parsed by binding power
+    (Pratt). Builds the same AST as PParser without any table
+    construction, in linear time, and keeps going after a syntax error
+    so every error of the source is reported at once (ParseError)
+    """
+
+    def __init__(self):
+        self.ast = ('Module',{'body':[]})
+        self.errors = []
+
+    def parse(self, tokens):
+        self.tokens = iter(tokens)
+        self.errors = []
+        self.tok = next(self.tokens, None)
+
+        body = self.statements(top=True)
+        self.ast[1]['body'] = body
+
+        if self.errors:
+            raise ParseError(self.errors)
+        return self.ast
+
+    # Tokens
+
+    def advance(self):
+        tok = self.tok
+        self.tok = next(self.tokens, None)
+        return tok
+
+    def expect(self, kind):
+        tok = self.tok
+        if tok is None or tok.type != kind:
+            self.error()
+        self.tok = next(self.tokens, None)
+        return tok
+
+    def report(self):
+        """Records a syntax error at the current token"""
+
+        tok = self.tok
+        if tok is None:
+            self.errors.append(('Syntax error at end of input', None, None))
+        else:
+            self.errors.append((f'Syntax error at line {tok.lineno}, token={tok.type}', tok.lineno, tok.index))
+
+    def error(self):
+        self.report()
+        raise _Error()
+
+    def synchronize(self, lineno):
+        """Skips to the next token that can start a statement"""
+
+        # The token the error was reported on is never a good restart point
+        if self.tok is not None:
+            self.advance()
+
+        while self.tok is not None:
+            kind = self.tok.type
+            if kind in STATEMENT_START:
+                return
+            # Statements usually start their own line
+            if kind == 'NAME' and lineno is not None and self.tok.lineno > lineno:
+                return
+            self.advance()
+
+    # Statements
+
+    def statements(self, top=False):
+        """One or more statements, up to a closing brace (or the end of input at the top level)"""
+
+        body = []
+        while self.tok is not None and (top or self.tok.type != 'RBRACE'):
+            tok = self.tok
+            if tok.type == 'RBRACE':
+                # Unbalanced brace at the top level
+                self.report()
+                self.advance()
+                continue
+
+            try:
+                body.append(self.statement())
+            except _Error:
+                self.synchronize(tok.lineno)
+
+        if not body:
+            self.report()
+        return body
+
+    def block(self):
+        self.expect('LBRACE')
+        body = self.statements()
+        self.expect('RBRACE')
+        return body
+
+    def statement(self):
+        kind = self.tok.type
+
+        if kind == 'NAME':
+            name = self.advance().value
+            if self.tok is not None and self.tok.type == 'EQ':
+                self.advance()
+                return utils.var_assign(name,self.expr())
+            if self.tok is not None and self.tok.type == 'LBRACKET':
+                self.advance()
+                index = self.expr()
+                self.expect('RBRACKET')
+                self.expect('EQ')
+                return utils.index_assign(name,index,self.expr())
+            self.expect('LPAREN')
+            params = self.params()
+            self.expect('RPAREN')
+            return utils.func_call(name,params)
+
+        elif kind == 'RETURN':
+            self.advance()
+            return utils.return_stmt(self.expr())
+
+        elif kind == 'IF':
+            self.advance()
+            test = self.expr()
+            body = self.block()
+            if self.tok is not None and self.tok.type == 'ELSE':
+                self.advance()
+                return utils.if_stmt(body,self.block(),test)
+            return utils.if_stmt(body,orelse=[],test=test)
+
+        elif kind == 'WHILE':
+            self.advance()
+            test = self.expr()
+            return utils.while_block(self.block(),test)
+
+        elif kind == 'UNTIL':
+            self.advance()
+            test = self.expr()
+            return utils.until_block(self.block(),test)
+
+        elif kind == 'PARALLEL':
+            self.advance()
+            name = self.expect('NAME').value
+            self.expect('EQ')
+            start = self.expr()
+            self.expect('COMMA')
+            end = self.expr()
+            clauses = []
+            while self.tok is not None and self.tok.type == 'NAME':
+                clauses.append(self.clause())
+            return utils.parallel_for(name,start,end,clauses,self.block())
+
+        elif kind == 'DEF':
+            self.advance()
+            name = self.expect('NAME').value
+            self.expect('LPAREN')
+            def_params = self.def_params()
+            self.expect('RPAREN')
+            self.expect('COLON')
+            ret = self.expect('NAME').value
+            return utils.function(name,def_params,ret,self.block())
+
+        self.error()
+
+    def clause(self):
+        """schedule(kind) / schedule(kind, chunk) / reduction(op:variable) of a parallel loop"""
+
+        name = self.advance().value
+        self.expect('LPAREN')
+        if self.tok is not None and self.tok.type in ('PLUS', 'TIMES'):
+            op = self.advance().value
+            self.expect('COLON')
+            variable = self.expect('NAME').value
+            self.expect('RPAREN')
+            return utils.reduction_clause(name,op,variable)
+
+        kind = self.expect('NAME').value
+        chunk = None
+        if self.tok is not None and self.tok.type == 'COMMA':
+            self.advance()
+            chunk = self.expr()
+        self.expect('RPAREN')
+        return utils.schedule_clause(name,kind,chunk)
+
+    def def_params(self):
+        """Comma separated `name:type` (or `name:type[]`), an empty parameter is None (like PParser)"""
+
+        params = []
+        while True:
+            if self.tok is not None and self.tok.type == 'NAME':
+                name = self.advance().value
+                self.expect('COLON')
+                Type = self.expect('NAME').value
+                if self.tok is not None and self.tok.type == 'LBRACKET':
+                    self.advance()
+                    self.expect('RBRACKET')
+                    Type += '[]'
+                params.append(utils.param(name,Type))
+            else:
+                params.append(None)
+
+            if self.tok is None or self.tok.type != 'COMMA':
+                return params
+            self.advance()
+
+    def params(self):
+        """Comma separated expressions, an empty parameter is None (like PParser)"""
+
+        params = []
+        while True:
+            if self.tok is not None and self.tok.type not in ('COMMA', 'RPAREN'):
+                params.append(self.expr())
+            else:
+                params.append(None)
+
+            if self.tok is None or self.tok.type != 'COMMA':
+                return params
+            self.advance()
+
+    # Expressions
+
+    def expr(self, rbp=0):
+        left = self.operand()
+
+        while self.tok is not None:
+            op = self.tok.type
+            if op not in BINARY:
+                break
+            lbp, assoc = BINARY[op]
+            if lbp <= rbp:
+                break
+
+            value = self.advance().value
+            if assoc == 'right':
+                right = self.expr(lbp - 1)
+            else:
+                right = self.expr(lbp)
+            left = utils.expression(value,left,right)
+
+            if assoc == 'nonassoc' and self.tok is not None and BINARY.get(self.tok.type, (0,))[0] == lbp:
+                self.error()
+
+        return left
+
+    def operand(self):
+        tok = self.tok
+        if tok is None:
+            self.error()
+        kind = tok.type
+
+        if kind == 'NAME':
+            self.advance()
+            if self.tok is not None and self.tok.type == 'LPAREN':
+                self.advance()
+                params = self.params()
+                self.expect('RPAREN')
+                return utils.func_call(tok.value,params)
+            if self.tok is not None and self.tok.type == 'LBRACKET':
+                self.advance()
+                index = self.expr()
+                self.expect('RBRACKET')
+                return utils.index(tok.value,index)
+            return utils.data('Name',tok.value)
+
+        elif kind == 'NUMBER':
+            self.advance()
+            return utils.data('Number',int(tok.value))
+
+        elif kind == 'FLOAT':
+            self.advance()
+            return utils.data('Float',float(tok.value))
+
+        elif kind == 'STRING':
+            self.advance()
+            return utils.data('String',tok.value)
+
+        elif kind == 'LPAREN':
+            self.advance()
+            value = self.expr()
+            self.expect('RPAREN')
+            return value
+
+        elif kind == 'MINUS':
+            # Only number literals can be negated
+            self.advance()
+            tok = self.tok
+            if tok is not None and tok.type == 'NUMBER':
+                self.advance()
+                return utils.data('Number',int(tok.value)*-1)
+            if tok is not None and tok.type == 'FLOAT':
+                self.advance()
+                return utils.data('Float',float(tok.value)*-1)
+
+        self.error()
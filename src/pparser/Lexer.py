@@ -13,6 +13,15 @@ Pointfloat = group(r'[0-9](?:_?[0-9])*\.(?:[0-9](?:_?[0-9])*)?',
                    r'\.[0-9](?:_?[0-9])*') + maybe(Exponent)
 Expfloat = r'[0-9](?:_?[0-9])*' + Exponent
 
+class LexError(Exception):
+    """Illegal character in the source"""
+
+    def __init__(self, char, lineno, index):
+        super().__init__(f'Illegal character {char}, in line {lineno}, index {index}')
+        self.char = char
+        self.lineno = lineno
+        self.index = index
+
 class PLexer(Lexer):
     tokens = {
         NAME, 
@@ -26,6 +35,8 @@ class PLexer(Lexer):
         RPAREN, 
         LBRACE, 
         RBRACE, 
+        LBRACKET,
+        RBRACKET,
         LT, 
         LE, 
         GT, 
@@ -42,6 +53,7 @@ class PLexer(Lexer):
         MOD,
         WHILE, 
         UNTIL, 
+        PARALLEL,
         BREAK, 
         CONTINUE,
         AND, 
@@ -78,6 +90,7 @@ class PLexer(Lexer):
     NAME['return'] = RETURN
     NAME['while'] = WHILE
     NAME['until'] = UNTIL
+    NAME['parallel'] = PARALLEL
     NAME['break'] = BREAK
     NAME['continue'] = CONTINUE
     # NAME['and'] = AND
@@ -97,6 +110,8 @@ class PLexer(Lexer):
     EQ = r'='
     LBRACE = r'\{'
     RBRACE = r'\}'
+    LBRACKET = r'\['
+    RBRACKET = r'\]'
     LPAREN = r'\('
     RPAREN = r'\)'
     PLUS = r'\+'
@@ -112,5 +127,4 @@ class PLexer(Lexer):
         pass
 
     def error(self, t):
-        print(f'Illegal character {t.value[0]}, in line {self.lineno}, index {self.index}')
-        exit()
+        raise LexError(t.value[0], self.lineno, self.index)
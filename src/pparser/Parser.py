@@ -32,7 +32,7 @@ class PParser(Parser):
     
     @_('RETURN expr')
     def statement(self,p):
-        return ('Return',{'value':p.expr})
+        return utils.return_stmt(p.expr)
     
         
     @_('DEF NAME LPAREN def_params RPAREN COLON NAME LBRACE statements RBRACE')
@@ -55,10 +55,40 @@ class PParser(Parser):
     def statement(self,p):
         return utils.until_block(p.statements,p.expr)
     
+    @_('PARALLEL NAME EQ expr COMMA expr clauses LBRACE statements RBRACE')
+    def statement(self,p):
+        return utils.parallel_for(p.NAME,p.expr0,p.expr1,p.clauses,p.statements)
+    
+    @_('clauses clause')
+    def clauses(self,p):
+        p.clauses.append(p.clause)
+        return p.clauses
+    
+    @_('')
+    def clauses(self,p):
+        return []
+    
+    @_('NAME LPAREN NAME RPAREN')
+    def clause(self,p):
+        return utils.schedule_clause(p.NAME0,p.NAME1)
+    
+    @_('NAME LPAREN NAME COMMA expr RPAREN')
+    def clause(self,p):
+        return utils.schedule_clause(p.NAME0,p.NAME1,p.expr)
+    
+    @_('NAME LPAREN PLUS COLON NAME RPAREN',
+       'NAME LPAREN TIMES COLON NAME RPAREN')
+    def clause(self,p):
+        return utils.reduction_clause(p.NAME0,p[2],p.NAME1)
+    
     @_('NAME EQ expr')
     def statement(self,p):
         return utils.var_assign(p.NAME,p.expr)
     
+    @_('NAME LBRACKET expr RBRACKET EQ expr')
+    def statement(self,p):
+        return utils.index_assign(p.NAME,p.expr0,p.expr1)
+    
     @_('NAME LPAREN params RPAREN')
     def statement(self,p):
         return utils.func_call(p.NAME,p.params)
@@ -74,7 +104,11 @@ class PParser(Parser):
     
     @_('NAME COLON NAME')
     def def_param(self,p):
-        return {'name':p.NAME0,'type':p.NAME1}
+        return utils.param(p.NAME0,p.NAME1)
+    
+    @_('NAME COLON NAME LBRACKET RBRACKET')
+    def def_param(self,p):
+        return utils.param(p.NAME0,p.NAME1+'[]')
     
     @_('')
     def def_param(self,p):
@@ -101,6 +135,10 @@ class PParser(Parser):
     def expr(self,p):
         return utils.func_call(p.NAME,p.params)
     
+    @_('NAME LBRACKET expr RBRACKET')
+    def expr(self,p):
+        return utils.index(p.NAME,p.expr)
+    
     @_('expr PLUS expr',
        'expr MINUS expr',
        'expr TIMES expr',
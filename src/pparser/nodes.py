@@ -0,0 +1,229 @@
+class Node:
+    """
+    AST node, it has a `kind` (the name the tuple AST used) and keeps
+    its fields in __slots__. node[0] and node[1]['field'] still work so
+    code written against the (Type, {fields}) tuples keeps working
+    """
+
+    __slots__ = ()
+
+    kind = None
+    fields = ()
+
+    # Names of fields in the tuple AST which aren't valid attribute names
+    aliases = {}
+
+    def __getitem__(self, key):
+        if key == 0:
+            return self.kind
+        if key == 1:
+            return self
+        return getattr(self, self.aliases.get(key, key))
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, x) == getattr(other, x) for x in self.fields)
+
+    def __hash__(self):
+        # Equal nodes (same kind and fields) hash the same, like as_tuple() compares
+        return hash((self.kind, tuple(_hashable(getattr(self, x)) for x in self.fields)))
+
+    def __repr__(self):
+        fields = ', '.join(f'{x}={getattr(self, x)!r}' for x in self.fields)
+        return f'{type(self).__name__}({fields})'
+
+    def children(self):
+        """Values of the fields"""
+
+        return [getattr(self, x) for x in self.fields]
+
+    def as_tuple(self):
+        """The node in the (Type, {fields}) format"""
+
+        names = {v:k for k,v in self.aliases.items()}
+        return (self.kind, {names.get(x, x):_as_tuple(getattr(self, x)) for x in self.fields})
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(x) for x in value)
+    return value
+
+def _as_tuple(value):
+    if isinstance(value, Node):
+        return value.as_tuple()
+    if isinstance(value, list):
+        return [_as_tuple(x) for x in value]
+    return value
+
+class Name(Node):
+    __slots__ = ('value',)
+    kind = 'Name'
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class Number(Node):
+    __slots__ = ('value',)
+    kind = 'Number'
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class Float(Node):
+    __slots__ = ('value',)
+    kind = 'Float'
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class String(Node):
+    __slots__ = ('value',)
+    kind = 'String'
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class Expression(Node):
+    __slots__ = ('op', 'lhs', 'rhs')
+    kind = 'Expression'
+    fields = ('op', 'lhs', 'rhs')
+
+    def __init__(self, op, lhs, rhs):
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+class VarAssign(Node):
+    __slots__ = ('name', 'value')
+    kind = 'VarAssign'
+    fields = ('name', 'value')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+class If(Node):
+    __slots__ = ('test', 'body', 'orelse')
+    kind = 'If'
+    fields = ('test', 'body', 'orelse')
+
+    def __init__(self, test, body, orelse):
+        self.test = test
+        self.body = body
+        self.orelse = orelse
+
+class While(Node):
+    __slots__ = ('test', 'body')
+    kind = 'While'
+    fields = ('test', 'body')
+
+    def __init__(self, test, body):
+        self.test = test
+        self.body = body
+
+class Until(Node):
+    __slots__ = ('test', 'body')
+    kind = 'Until'
+    fields = ('test', 'body')
+
+    def __init__(self, test, body):
+        self.test = test
+        self.body = body
+
+class Parallel(Node):
+    """
+    parallel name = start, end schedule(kind, chunk) reduction(op:variable) { body },
+    reductions is a list of (op, variable)
+    """
+
+    __slots__ = ('name', 'start', 'end', 'schedule', 'chunk', 'reductions', 'body')
+    kind = 'Parallel'
+    fields = ('name', 'start', 'end', 'schedule', 'chunk', 'reductions', 'body')
+
+    def __init__(self, name, start, end, schedule, chunk, reductions, body):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.schedule = schedule
+        self.chunk = chunk
+        self.reductions = reductions
+        self.body = body
+
+class FuncCall(Node):
+    __slots__ = ('name', 'params')
+    kind = 'FuncCall'
+    fields = ('name', 'params')
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+
+class Index(Node):
+    """name[index]"""
+
+    __slots__ = ('name', 'index')
+    kind = 'Index'
+    fields = ('name', 'index')
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+class IndexAssign(Node):
+    """name[index] = value"""
+
+    __slots__ = ('name', 'index', 'value')
+    kind = 'IndexAssign'
+    fields = ('name', 'index', 'value')
+
+    def __init__(self, name, index, value):
+        self.name = name
+        self.index = index
+        self.value = value
+
+class Return(Node):
+    __slots__ = ('value',)
+    kind = 'Return'
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class Param(Node):
+    """`name:type` in a function definition"""
+
+    __slots__ = ('name', 'type')
+    kind = 'Param'
+    fields = ('name', 'type')
+
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+    def as_tuple(self):
+        return {'name':self.name, 'type':self.type}
+
+class Def(Node):
+    __slots__ = ('name', 'def_params', 'return_type', 'body')
+    kind = 'Def'
+    fields = ('name', 'def_params', 'return_type', 'body')
+    aliases = {'return':'return_type'}
+
+    def __init__(self, name, def_params, return_type, body):
+        self.name = name
+        self.def_params = def_params
+        self.return_type = return_type
+        self.body = body
+
+# Leaf nodes by the Type name utils.data takes
+DATA = {
+    'Name':Name,
+    'Number':Number,
+    'Float':Float,
+    'String':String,
+}
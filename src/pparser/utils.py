@@ -1,8 +1,10 @@
+from src.pparser import nodes
+
 def data(Type,value):
     """
     Type (NAME | FLOAT | NUMBER | STRING)
     """
-    return(Type,{'value':value})
+    return nodes.DATA[Type](value)
 
 def expression(op,lhs,rhs):
     """
@@ -11,35 +13,91 @@ def expression(op,lhs,rhs):
     op (operator)
     """
 
-    return ('Expression',{'op':op,'lhs':lhs,'rhs':rhs})
+    return nodes.Expression(op,lhs,rhs)
 
 def var_assign(name,value):
     """
     var name = value
     """
-    return('VarAssign',{'value':value,'name':name})
+    return nodes.VarAssign(name,value)
 
 def if_stmt(body,orelse,test):
 
-    return ('If',{'body':body,'test':test,'orelse':orelse})
+    return nodes.If(test,body,orelse)
 
 def while_block(body,test):
 
-    return ('While',{'test':test,'body':body})
+    return nodes.While(test,body)
 
 def until_block(body,test):
 
-    return ('Until',{'test':test,'body':body})
+    return nodes.Until(test,body)
+
+def parallel_for(name,start,end,clauses,body):
+    """
+    parallel name = start, end clauses* { body }
+    clauses are ('schedule', kind, chunk) and ('reduction', op, variable)
+    """
+
+    schedule = 'static'
+    chunk = None
+    reductions = []
+    for clause in clauses:
+        if clause[0] == 'schedule':
+            schedule,chunk = clause[1:]
+        else:
+            reductions.append(clause[1:])
+    return nodes.Parallel(name,start,end,schedule,chunk,reductions,body)
+
+def schedule_clause(name,kind,chunk=None):
+    """
+    schedule (static | dynamic [, chunk])
+    """
+    if name != 'schedule' or kind not in ('static','dynamic'):
+        raise ValueError(f'Unknown parallel loop clause {name}({kind})')
+    return ('schedule',kind,chunk)
+
+def reduction_clause(name,op,variable):
+    """
+    reduction (op : variable), op is + or *
+    """
+    if name != 'reduction':
+        raise ValueError(f'Unknown parallel loop clause {name}({op}:{variable})')
+    return ('reduction',op,variable)
 
 def func_call(name,params):
     """
     name (params*)
     """
-    return ('FuncCall',{'params':params,'name':name})
+    return nodes.FuncCall(name,params)
+
+def index(name,index):
+    """
+    name [index]
+    """
+    return nodes.Index(name,index)
+
+def index_assign(name,index,value):
+    """
+    name [index] = value
+    """
+    return nodes.IndexAssign(name,index,value)
+
+def return_stmt(value):
+    """
+    return value
+    """
+    return nodes.Return(value)
+
+def param(name,Type):
+    """
+    name : type
+    """
+    return nodes.Param(name,Type)
 
 def function(name,def_params,ret,body):
     """
     def name (def_params*) : return_type
     """
-    
-    return ('Def',{'name':name,'return':ret,'body':body, 'def_params':def_params if def_params else []})
+
+    return nodes.Def(name,def_params if def_params else [],ret,body)
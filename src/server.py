@@ -0,0 +1,274 @@
+from src import LexError, ParseError, initialize_llvm
+from src.session import Session
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from time import perf_counter_ns
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import weakref
+
+
+# Programs compiled in a session before it's replaced by a new one, the
+# engine keeps the code of every program so a session can't live forever
+RECYCLE_UNITS = 256
+
+# Seconds a program can run before the server gives up on it
+RUN_TIMEOUT = 10
+
+def socket_path():
+    """Default path of the server's socket, $GABBY_SOCKET or one per user in the temporary directory"""
+
+    # client.py has a copy of this, it doesn't import anything from src
+    return os.environ.get('GABBY_SOCKET') or os.path.join(tempfile.gettempdir(), f'gabby-{os.getuid()}.sock')
+
+class EntryError(TypeError):
+    """The entry function of a run request can't be called like main"""
+
+    def __init__(self, entry, signature):
+        return_type, param_types = signature
+        super().__init__(f"The entry function '{entry}' must take no parameters and return an int, "
+                         f"it takes ({', '.join(param_types)}) and returns {return_type}")
+        self.entry = entry
+        self.signature = signature
+
+def error_response(error):
+    """`error` of a response for an exception"""
+
+    response = {'type':type(error).__name__, 'message':str(error)}
+    if isinstance(error, ParseError):
+        response['errors'] = [{'message':message, 'lineno':lineno, 'index':index}
+                              for message, lineno, index in error.errors]
+    elif isinstance(error, LexError):
+        response['errors'] = [{'message':str(error), 'lineno':error.lineno, 'index':error.index}]
+    elif isinstance(error, EntryError):
+        return_type, param_types = error.signature
+        response['entry'] = error.entry
+        response['signature'] = [return_type, list(param_types)]
+    return response
+
+class CompileServer:
+    """
+    Compiles and runs programs for clients connecting to a Unix socket,
+    with LLVM, the parser and a Session per optimization level kept
+    warm between requests.
+
+    The protocol is a JSON object per line each way. Requests are
+    {"action": "run" | "compile" | "ping" | "shutdown", "code": ...,
+    "opt_level": 0, "entry": "main", "id": ...}, every response has the
+    request's id and "ok", then "result", "output" (what the program
+    printed), "signatures" and "timings" (ns) or "error"
+    ({"type", "message"} plus "errors" with the line of each syntax error).
+
+    Connections are served by a pool of `workers` threads, the ones over
+    that wait for a free worker. Compiling holds the session's lock, the
+    programs of a session run one at a time since they share its output
+    buffer, each request's output goes to a sink of its own.
+
+    Programs run in the server's process, without any isolation: a
+    program that crashes (an index out of bounds...) takes the server
+    down with it. One that doesn't return in `timeout` seconds gets a
+    TimeoutError response and its session is replaced, but its thread
+    can't be stopped and keeps running until the server exits
+    """
+
+    def __init__(self, path=None, workers=4, recycle=RECYCLE_UNITS, timeout=RUN_TIMEOUT):
+        self.path = path or socket_path()
+        self.workers = workers
+        self.recycle = recycle
+        self.timeout = timeout
+
+        # (opt_level, cpu, features) -> Session, and the lock running a program of each Session holds
+        self.sessions = {}
+        self.sessions_lock = Lock()
+        self.run_locks = weakref.WeakKeyDictionary()
+
+        self.closed = Event()
+        self.listener = None
+        self.requests = 0
+        self.requests_lock = Lock()
+
+    def session(self, opt_level, cpu=None, features=None):
+        key = opt_level, cpu, features
+        with self.sessions_lock:
+            session = self.sessions.get(key)
+            if session is None or session.units >= self.recycle:
+                # Programs still running keep the old session alive
+                session = self.sessions[key] = Session(opt_level, cpu, features)
+                self.run_locks[session] = Lock()
+            return session
+
+    def discard(self, session):
+        """Stops giving out the session, a program of it doesn't return"""
+
+        with self.sessions_lock:
+            for key, x in list(self.sessions.items()):
+                if x is session:
+                    del self.sessions[key]
+
+    def warm_up(self):
+        """Initializes LLVM and compiles a program so the first request doesn't pay for it"""
+
+        initialize_llvm()
+        self.session(0).compile('def main():int{\n    return 0\n}\n')
+
+    def bind(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left behind by a server that didn't exit cleanly
+                os.unlink(self.path)
+            else:
+                probe.close()
+                raise RuntimeError(f'A server is already listening on {self.path}')
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        self.listener = listener
+
+    def serve_forever(self):
+        """Serves until a shutdown request (or KeyboardInterrupt), removes the socket when done"""
+
+        self.warm_up()
+        if self.listener is None:
+            self.bind()
+
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                while not self.closed.is_set():
+                    connection,_ = self.listener.accept()
+                    if self.closed.is_set():
+                        connection.close()
+                        break
+                    pool.submit(self.serve_connection, connection)
+        finally:
+            self.listener.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def shutdown(self):
+        """Stops accepting connections, the ones being served are finished"""
+
+        self.closed.set()
+        # Wakes up accept
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake:
+                wake.connect(self.path)
+        except OSError:
+            pass
+
+    def serve_connection(self, connection):
+        with connection, connection.makefile('rwb') as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                response = self.handle(line)
+                stream.write(json.dumps(response).encode('utf8') + b'\n')
+                stream.flush()
+                if self.closed.is_set():
+                    return
+
+    def handle(self, line):
+        """Response (dict) to a request (one line of JSON)"""
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('A request must be a JSON object')
+        except ValueError as e:
+            return {'id':None, 'ok':False, 'error':error_response(e)}
+
+        response = {'id':request.get('id')}
+        with self.requests_lock:
+            self.requests += 1
+        try:
+            response.update(self.dispatch(request))
+            response['ok'] = True
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = error_response(e)
+        return response
+
+    def dispatch(self, request):
+        action = request.get('action', 'run')
+        if action == 'ping':
+            return {'pid':os.getpid(), 'requests':self.requests}
+        if action == 'shutdown':
+            self.shutdown()
+            return {}
+        if action not in ('run', 'compile'):
+            raise ValueError(f'Unknown action {action!r}, expected run, compile, ping or shutdown')
+
+        code = request.get('code')
+        if not isinstance(code, str):
+            raise ValueError('The request has no code')
+        session = self.session(int(request.get('opt_level', 0)), request.get('cpu'), request.get('features'))
+
+        start = perf_counter_ns()
+        program = session.compile(code)
+        compiled = perf_counter_ns()
+        result = {
+            'signatures':{name:[ret, list(params)] for name, (ret, params) in program.signatures.items()},
+            'timings':{'compile_ns':compiled - start},
+        }
+        if action == 'compile':
+            return result
+
+        entry = request.get('entry', 'main')
+        if entry not in program.names:
+            raise ValueError(f"The program has no function '{entry}'")
+        # It's called through CFUNCTYPE(c_int) with no arguments
+        if program.signatures[entry] != ('int', ()):
+            raise EntryError(entry, program.signatures[entry])
+        start = perf_counter_ns()
+        result['result'], output = self.run(session, program, entry)
+        result['timings']['run_ns'] = perf_counter_ns() - start
+        result['output'] = output.decode('utf8', errors='replace')
+        return result
+
+    def run(self, session, program, entry):
+        """
+        Runs the program's entry function on a thread of its own, returns
+        its result and what it printed. Raises TimeoutError if it (or the
+        program of the session running before it) doesn't return in time
+        """
+
+        lock = self.run_locks[session]
+        if not lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Another program didn't return in {self.timeout} s")
+
+        output = io.BytesIO()
+        outcome = {}
+        def target():
+            try:
+                outcome['result'] = program.run(entry, output)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                lock.release()
+
+        thread = Thread(target=target, name=f'run {entry}', daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            # The session's lock is never released, later requests get a new session
+            self.discard(session)
+            raise TimeoutError(f"The program didn't return in {self.timeout} s, it keeps running in the server")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result'], output.getvalue()
+
+def serve(path=None, workers=4, timeout=RUN_TIMEOUT):
+    server = CompileServer(path, workers, timeout=timeout)
+    print(f'Listening on {server.path}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,330 @@
+from src import create_target_machine, initialize_llvm, parse
+from src.compiler.callgraph import callees, signature
+from src.compiler.compiler import Compiler
+from src.compiler.effects import function_attributes
+from src.compiler.optimizer import optimize, pass_manager
+from src.compiler.runtime import redirect_output
+
+import llvmlite.binding as llvm
+from ctypes import CFUNCTYPE, c_bool, c_double, c_float, c_int, c_int32, c_void_p, addressof, byref, sizeof
+from functools import lru_cache, wraps
+from hashlib import sha256
+from itertools import count
+from threading import Lock
+import atexit
+import weakref
+
+
+class ArrayArgument:
+    """
+    ctypes argument type of `type[]` parameters. Takes any writable C
+    contiguous buffer of the element type (NumPy arrays, array.array,
+    memoryview, ctypes arrays...) and passes a pointer to its memory,
+    nothing is copied so the function's stores are seen by the caller
+    """
+
+    def __init__(self, ctype, formats):
+        self.ctype = ctype
+
+        # struct module format characters of the element type
+        self.formats = formats
+
+    def from_param(self, value):
+        view = memoryview(value)
+        if view.format.lstrip('@=<') not in self.formats or view.itemsize != sizeof(self.ctype):
+            raise TypeError(f"Expected a buffer of {self.ctype.__name__}, got format '{view.format}'")
+        if view.readonly:
+            raise TypeError('Arrays are passed by pointer, the buffer must be writable')
+        if not view.nbytes:
+            return None
+        # The ctypes object refers to the buffer (and keeps it alive) without copying it
+        return byref(self.ctype.from_buffer(value))
+
+# Type in the language -> ctypes type
+CTYPES = {
+    'bool':c_bool,
+    'int':c_int32,
+    'float':c_float,
+    'double':c_double,
+    'void':None,
+    'int[]':ArrayArgument(c_int32, 'il'),
+    'float[]':ArrayArgument(c_float, 'f'),
+    'double[]':ArrayArgument(c_double, 'd'),
+}
+
+@lru_cache(maxsize=None)
+def prototype(return_type, param_types):
+    """ctypes function type of a signature, built once for every signature"""
+
+    try:
+        return CFUNCTYPE(CTYPES[return_type], *[CTYPES[x] for x in param_types])
+    except KeyError as e:
+        raise TypeError(f"Functions taking or returning '{e.args[0]}' can't be called from Python") from None
+
+class Program:
+    """
+    A program compiled in a Session, its functions are renamed to `<unit>.<name>`.
+    Functions can be called from Python as attributes of the program,
+    `program.fact(6)`, arguments and return values are converted
+    according to the function's declaration
+    """
+
+    def __init__(self, session, unit, names, signatures=None):
+        self.session = session
+        self.unit = unit
+
+        # Source name -> symbol name in the engine
+        self.names = names
+
+        # Source name -> (return type, parameter types)
+        self.signatures = signatures or {}
+
+        # Source name -> ctypes function, built the first time it's used
+        self.functions = {}
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('names', ()):
+            return self.function(name)
+        raise AttributeError(f"Program has no function '{name}'")
+
+    def function(self, name):
+        """The function `name` as a Python callable, what it printed is written out when it returns"""
+
+        if name not in self.functions:
+            cfunc = prototype(*self.signatures[name])(self.address(name))
+            flush = self.session.flush
+
+            @wraps(cfunc)
+            def call(*args):
+                try:
+                    return cfunc(*args)
+                finally:
+                    flush()
+
+            self.functions[name] = call
+        return self.functions[name]
+
+    def address(self, name):
+        """Address of the function `name` of the program"""
+
+        return self.session.address(self.names[name])
+
+    def run(self, entry='main', output=None):
+        """
+        Calls the entry function (which takes no arguments and returns an int),
+        what it prints goes to output.write (bytes) if output is given
+        """
+
+        with redirect_output(self.session.engine.get_global_value_address('gabby.output'), output):
+            try:
+                return CFUNCTYPE(c_int)(self.address(entry))()
+            finally:
+                # Only main writes out the output buffer when it returns
+                self.session.flush()
+
+class Session:
+    """
+    Long lived JIT, LLVM and the target machine are initialized once
+    and every program compiled in the session is added to the same MCJIT engine
+    """
+
+    def __init__(self, opt_level=0, cpu=None, features=None):
+        initialize_llvm()
+
+        self.opt_level = opt_level
+        self.triple = llvm.get_default_triple()
+        self.target_machine = create_target_machine(cpu, features)
+        self.data_layout = str(self.target_machine.target_data)
+        self.engine = llvm.create_mcjit_compiler(llvm.parse_assembly(''), self.target_machine)
+        self.pass_manager = pass_manager(opt_level, self.target_machine)
+
+        # Number of programs compiled, used to give every program's symbols a unique prefix
+        self.units = 0
+
+        # MCJIT isn't thread safe
+        self.lock = Lock()
+
+        # gabby.flush(), once a program printing something is compiled (see OutputRuntime),
+        # compile renames it along with the program's other functions
+        self.flush_symbol = 'gabby.flush'
+        self.flush_function = None
+
+        # What's still buffered is written out when Python exits
+        session = weakref.ref(self)
+        atexit.register(lambda: session() is not None and session().flush())
+
+    def flush(self):
+        """Writes out the output buffer the programs of the session share"""
+
+        if self.flush_function is None:
+            address = self.engine.get_function_address(self.flush_symbol)
+            if not address:
+                return
+            self.flush_function = CFUNCTYPE(None)(address)
+        self.flush_function()
+
+    def compile(self, code):
+        """Compiles and links the code, returns a Program"""
+
+        with self.lock:
+            unit = f'unit{self.units}'
+            self.units += 1
+
+            compiler = Compiler(unit)
+            compiler.compile(parse(code))
+            module = compiler.module
+            module.triple = self.triple
+            module.data_layout = self.data_layout
+
+            llvm_ir_parsed = llvm.parse_assembly(str(module))
+            llvm_ir_parsed.verify()
+            if self.opt_level:
+                optimize(llvm_ir_parsed, pm=self.pass_manager)
+
+            # Every program has its own main, so the functions it defines are
+            # renamed to not clash with the ones already in the engine
+            names = {}
+            for func in llvm_ir_parsed.functions:
+                if not func.is_declaration and func.linkage != llvm.Linkage.private:
+                    name = func.name
+                    func.name = f'{unit}.{name}'
+                    names[name] = func.name
+            if self.flush_function is None and 'gabby.flush' in names:
+                # Every copy writes out the same buffer
+                self.flush_symbol = names['gabby.flush']
+
+            self.engine.add_module(llvm_ir_parsed)
+            self.engine.finalize_object()
+
+        return Program(self, unit, names, compiler.signatures)
+
+    def address(self, symbol):
+        return self.engine.get_function_address(symbol)
+
+    def run(self, code, entry='main', output=None):
+        """Compiles the code and calls its entry function, returns what it returns"""
+
+        return self.compile(code).run(entry, output)
+
+# (opt_level, cpu, features) -> Session used by compile_module
+_sessions = {}
+
+def compile_module(code, opt_level=2, cpu=None, features=None):
+    """
+    Compiles the code in a Session shared by every call with the same
+    opt_level and target, returns the Program, its functions can be called
+    as attributes: compile_module(code).in_mandelbrot(0.1, 0.2, 1000)
+    """
+
+    config = opt_level, cpu, features
+    if config not in _sessions:
+        _sessions[config] = Session(*config)
+    return _sessions[config].compile(code)
+
+def fingerprint(defn, signatures):
+    """
+    Hash of a Def and of the signatures of the functions it calls
+    (signatures maps names to signature(), None for undefined functions)
+    """
+
+    called = sorted((name, signatures.get(name)) for name in callees(defn))
+    return sha256(repr((defn.as_tuple(), called)).encode('utf8')).hexdigest()
+
+class IncrementalSession(Session):
+    """
+    Session which only recompiles what changed when the same program
+    is compiled again. Functions call each other through function
+    pointer slots, a function is recompiled when its code or the
+    signature of a function it calls changes and its slot is pointed
+    to the new machine code, so the callers keep theirs. Calls between
+    functions being indirect, they aren't inlined at -O2 and -O3, and a
+    function's attributes don't depend on what the functions it calls do
+    """
+
+    sessions = count()
+
+    def __init__(self, opt_level=0, cpu=None, features=None):
+        super().__init__(opt_level, cpu, features)
+
+        # Prefix of every symbol, slots are process wide symbols
+        self.prefix = f'incremental{next(self.sessions)}'
+
+        # Function name -> (fingerprint, symbol of its current code)
+        self.functions = {}
+
+        # Function name -> c_void_p holding the address of the function's current code
+        self.slots = {}
+
+        # Names of the functions the last compile generated code for
+        self.recompiled = []
+
+    def slot(self, name):
+        if name not in self.slots:
+            slot = self.slots[name] = c_void_p()
+            llvm.add_symbol(f'{self.prefix}.slot.{name}', addressof(slot))
+        return self.slots[name]
+
+    def compile_functions(self, defs, signatures, symbols):
+        """Compiles the functions to a parsed (and optimized) module"""
+
+        # A function's effects are inferred from its own body alone, the
+        # functions it calls are unknown: their slots can be pointed to new
+        # code without recompiling it, which would leave it with stale attributes
+        attributes = {}
+        for defn in defs:
+            attributes.update(function_attributes([defn]))
+
+        compiler = Compiler(f'{self.prefix}.unit{self.units}', symbols=symbols, attributes=attributes)
+        for name, types in signatures.items():
+            compiler.declare_slot(name, *types, f'{self.prefix}.slot.{name}')
+        compiler.compile(defs)
+        compiler.module.triple = self.triple
+        compiler.module.data_layout = self.data_layout
+
+        module = llvm.parse_assembly(str(compiler.module))
+        module.verify()
+        if self.opt_level:
+            optimize(module, pm=self.pass_manager)
+        return module
+
+    def compile(self, code):
+        """
+        Compiles the functions of the code which changed since the last
+        compile, returns a Program
+        """
+
+        with self.lock:
+            defs = {x.name:x for x in parse(code) if x.kind == 'Def'}
+            signatures = {name:signature(x) for name, x in defs.items()}
+
+            changed = {}
+            for name, defn in defs.items():
+                digest = fingerprint(defn, signatures)
+                if self.functions.get(name, (None,))[0] != digest:
+                    changed[name] = digest
+
+            if changed:
+                symbols = {name:f'{self.prefix}.{name}.{self.units}' for name in changed}
+                module = self.compile_functions([defs[x] for x in changed], signatures, symbols)
+                self.units += 1
+
+                for name in changed:
+                    self.slot(name)
+                self.engine.add_module(module)
+                self.engine.finalize_object()
+
+                # The previous code of the changed functions stays in the engine
+                # (MCJIT can't free part of a module), nothing calls it anymore
+                for name, digest in changed.items():
+                    self.slots[name].value = self.engine.get_function_address(symbols[name])
+                    self.functions[name] = digest, symbols[name]
+
+            for name in list(self.functions):
+                if name not in defs:
+                    del self.functions[name]
+            self.recompiled = list(changed)
+
+        return Program(self, self.prefix, {name:name for name in defs}, signatures)
+
+    def address(self, name):
+        return self.slots[name].value
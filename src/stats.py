@@ -0,0 +1,138 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter_ns
+import json
+import resource
+import tracemalloc
+
+from src.pparser.nodes import Node
+
+
+class Phase:
+    """Timing and memory of one compilation phase"""
+
+    __slots__ = ('name', 'time_ns', 'peak_memory', 'max_rss')
+
+    def __init__(self, name, time_ns, peak_memory, max_rss):
+        self.name = name
+        self.time_ns = time_ns
+
+        # Peak of the memory Python allocated during the phase (bytes, tracemalloc)
+        self.peak_memory = peak_memory
+
+        # Peak resident set size of the process at the end of the phase (bytes),
+        # this one includes LLVM's allocations
+        self.max_rss = max_rss
+
+    def as_dict(self):
+        return {'name':self.name, 'time_ns':self.time_ns,
+                'peak_memory':self.peak_memory, 'max_rss':self.max_rss}
+
+class CompileStats:
+    """
+    Collects per phase timings (perf_counter_ns) of lexing, parsing,
+    codegen, LLVM and execution, plus the size of what each phase
+    produced. With trace_memory the peak memory Python allocates in
+    each phase is traced too, tracemalloc slows down every allocation
+    so the times are then only comparable with other traced runs
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+
+        # tokens, ast_nodes, functions, ir_instructions...
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            tracemalloc.reset_peak()
+            current,_ = tracemalloc.get_traced_memory()
+
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            time_ns = perf_counter_ns() - start
+
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - current
+                if started:
+                    tracemalloc.stop()
+
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            self.phases.append(Phase(name, time_ns, peak, max_rss))
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def __getitem__(self, name):
+        """Phase by name"""
+
+        for phase in self.phases:
+            if phase.name == name:
+                return phase
+        raise KeyError(name)
+
+    @property
+    def total_ns(self):
+        return sum(x.time_ns for x in self.phases)
+
+    def as_dict(self):
+        return {
+            'phases':[x.as_dict() for x in self.phases],
+            'counts':dict(self.counts),
+            'total_ns':self.total_ns,
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def report(self):
+        """Human readable table"""
+
+        lines = ['{:<16} {:>12} {:>12} {:>12}'.format('phase', 'time (ms)', 'peak (KiB)', 'rss (MiB)')]
+        for x in self.phases:
+            peak = '-' if x.peak_memory is None else '{:.1f}'.format(x.peak_memory / 1024)
+            lines.append('{:<16} {:>12.3f} {:>12} {:>12.1f}'.format(
+                x.name, x.time_ns / 1e6, peak, x.max_rss / 1024 / 1024))
+        lines.append('{:<16} {:>12.3f}'.format('total', self.total_ns / 1e6))
+        if self.trace_memory:
+            lines.append("(memory traced, the times include tracemalloc's overhead)")
+        lines.append('')
+        for name, value in self.counts.items():
+            lines.append(f'{name}: {value}')
+        return '\n'.join(lines)
+
+def phase(stats, name):
+    """stats.phase(name), or nothing when stats is None"""
+
+    if stats is None:
+        return nullcontext()
+    return stats.phase(name)
+
+def count_nodes(ast):
+    """Number of nodes of an AST"""
+
+    n = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Node):
+            n += 1
+            stack.extend(node.children())
+    return n
+
+def count_instructions(module):
+    """Number of instructions of a parsed (llvmlite.binding) module"""
+
+    return sum(len(list(block.instructions))
+               for func in module.functions
+               for block in func.blocks)